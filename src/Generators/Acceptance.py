@@ -0,0 +1,63 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+from numpy import uint8
+from numpy.typing import NDArray as array
+
+from Gen_Helpers import EXIT_COUNTS
+
+@dataclass(frozen = True)
+class AcceptanceCriteria:
+    min_rooms: int = 0
+    max_rooms: int | None = None
+    min_dead_ends: int = 0
+    min_height: int = 0
+    min_width: int = 0
+    max_height: int | None = None
+    max_width: int | None = None
+
+    def rejects(self, dungeon_map: array[uint8]) -> str | None:
+        height, width = dungeon_map.shape
+        if height < self.min_height or width < self.min_width:
+            return "bbox_small"
+        if (
+            (self.max_height is not None and height > self.max_height)
+            or (self.max_width is not None and width > self.max_width)
+        ):
+            return "bbox_large"
+        active = dungeon_map != 0
+        rooms = int(np.count_nonzero(active))
+        if rooms < self.min_rooms:
+            return "min_rooms"
+        if self.max_rooms is not None and rooms > self.max_rooms:
+            return "max_rooms"
+        if self.min_dead_ends:
+            dead_ends = int(np.count_nonzero(EXIT_COUNTS[dungeon_map[active] & 0b01111] == 1))
+            if dead_ends < self.min_dead_ends:
+                return "min_dead_ends"
+        return None
+
+@dataclass
+class RejectionStats:
+    attempts: int = 0
+    accepted: int = 0
+    rejected: int = 0
+    skipped_seeds: int = 0
+    reasons: dict[str, int] = field(default_factory = dict)
+    stage_1_seconds: float = 0.0
+    downstream_seconds: float = 0.0
+
+    @property
+    def rejection_rate(self) -> float:
+        return self.rejected / self.attempts if self.attempts else 0.0
+
+    @property
+    def saved_seconds(self) -> float:
+        if not self.accepted:
+            return 0.0
+        return self.rejected * self.downstream_seconds / self.accepted
+
+    def record_rejection(self, reason: str) -> None:
+        self.rejected += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        return
@@ -0,0 +1,158 @@
+import os
+from collections.abc import Iterator
+from types import TracebackType
+
+import numpy as np
+from numpy import uint8
+from numpy.typing import NDArray as array
+
+from Gen_Helpers import derive_seed
+
+INDEX_DTYPE = np.dtype([
+    ("seed", "<u8"),
+    ("tile_offset", "<i8"),
+    ("tile_height", "<u4"),
+    ("tile_width", "<u4"),
+    ("theme_offset", "<i8"),
+    ("theme_height", "<u4"),
+    ("theme_width", "<u4"),
+])
+
+SEED_LIMIT = 1 << 64
+
+def _shard_paths(directory: str | os.PathLike, shard: int) -> tuple[str, str]:
+    stem = os.path.join(directory, f"shard_{shard:05d}")
+    return f"{stem}.bin", f"{stem}.idx.npy"
+
+class ArchiveWriter:
+    def __init__(
+            self,
+            directory: str | os.PathLike,
+            shard_bytes: int = 1 << 30
+    ) -> None:
+        os.makedirs(directory, exist_ok = True)
+        self.directory = directory
+        self.shard_bytes = shard_bytes
+        self._shard = 0
+        self._seeds: set[int] = set()
+        while True:
+            index_path = _shard_paths(directory, self._shard)[1]
+            if not os.path.exists(index_path):
+                break
+            self._seeds.update(np.load(index_path)["seed"].tolist())
+            self._shard += 1
+        self._file = None
+        self._rows: list[tuple[int, int, int, int, int, int, int]] = []
+        self._offset = 0
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(
+            self,
+            exc_type: type[BaseException] | None,
+            exc: BaseException | None,
+            traceback: TracebackType | None
+    ) -> None:
+        self.close()
+        return
+
+    def add(
+            self,
+            seed: int | str,
+            tilemap: array[uint8],
+            theme_map: array[uint8]
+    ) -> None:
+        seed = derive_seed(seed)
+        if seed is None:
+            raise ValueError("ArchiveWriter.add needs a concrete seed, got None.")
+        if not 0 <= seed < SEED_LIMIT:
+            raise ValueError(f"ArchiveWriter.add needs a seed in [0, 2**64), got {seed}.")
+        if seed in self._seeds:
+            raise ValueError(f"Seed {seed} is already in the archive.")
+        if self._file is None:
+            self._file = open(_shard_paths(self.directory, self._shard)[0], "wb")
+        tile_offset = self._offset
+        theme_offset = tile_offset + tilemap.size
+        self._file.write(np.ascontiguousarray(tilemap, dtype = uint8).data)
+        self._file.write(np.ascontiguousarray(theme_map, dtype = uint8).data)
+        self._offset = theme_offset + theme_map.size
+        self._rows.append((seed, tile_offset, *tilemap.shape, theme_offset, *theme_map.shape))
+        self._seeds.add(seed)
+        if self._offset >= self.shard_bytes:
+            self._finish_shard()
+        return
+
+    def _finish_shard(self) -> None:
+        if self._file is None:
+            return
+        self._file.close()
+        index = np.array(self._rows, dtype = INDEX_DTYPE)
+        index.sort(order = "seed")
+        np.save(_shard_paths(self.directory, self._shard)[1], index)
+        self._file = None
+        self._rows.clear()
+        self._offset = 0
+        self._shard += 1
+        return
+
+    def close(self) -> None:
+        self._finish_shard()
+        return
+
+class DungeonArchive:
+    def __init__(self, directory: str | os.PathLike) -> None:
+        self.directory = directory
+        self._indexes: list[array] = []
+        self._shards: list[np.memmap] = []
+        shard = 0
+        while True:
+            data_path, index_path = _shard_paths(directory, shard)
+            if not os.path.exists(index_path):
+                break
+            index = np.load(index_path, mmap_mode = "r")
+            self._indexes.append(index)
+            if len(index) and os.path.getsize(data_path):
+                self._shards.append(np.memmap(data_path, dtype = uint8, mode = "r"))
+            else:
+                self._shards.append(np.empty(0, dtype = uint8))
+            shard += 1
+
+    def __len__(self) -> int:
+        return sum(len(index) for index in self._indexes)
+
+    def __contains__(self, seed: int | str) -> bool:
+        return self._locate(derive_seed(seed)) is not None
+
+    def __getitem__(self, seed: int | str) -> tuple[array[uint8], array[uint8]]:
+        return self.get(seed)
+
+    def seeds(self) -> Iterator[int]:
+        for index in self._indexes:
+            yield from index["seed"].tolist()
+
+    def _locate(self, seed: int | None) -> tuple[int, int] | None:
+        if seed is None or not 0 <= seed < SEED_LIMIT:
+            return None
+        key = np.uint64(seed)
+        for shard, index in enumerate(self._indexes):
+            seeds = index["seed"]
+            row = int(np.searchsorted(seeds, key))
+            if row < len(seeds) and seeds[row] == key:
+                return shard, row
+        return None
+
+    def get(self, seed: int | str) -> tuple[array[uint8], array[uint8]]:
+        location = self._locate(derive_seed(seed))
+        if location is None:
+            raise KeyError(seed)
+        shard, row = location
+        entry = self._indexes[shard][row]
+        data = self._shards[shard]
+        tile_shape = (int(entry["tile_height"]), int(entry["tile_width"]))
+        theme_shape = (int(entry["theme_height"]), int(entry["theme_width"]))
+        tile_start = int(entry["tile_offset"])
+        theme_start = int(entry["theme_offset"])
+        tilemap = data[tile_start:tile_start + tile_shape[0] * tile_shape[1]]
+        theme_map = data[theme_start:theme_start + theme_shape[0] * theme_shape[1]]
+        return tilemap.reshape(tile_shape), theme_map.reshape(theme_shape)
@@ -0,0 +1,175 @@
+import json
+import os
+from collections import OrderedDict
+from dataclasses import astuple
+from hashlib import blake2b
+from random import Random
+from typing import NamedTuple
+
+import numpy as np
+from numpy import uint8
+from numpy.typing import NDArray as array
+
+import Stage_1, Stage_2, Stage_3
+from Gen_Helpers import (
+    SHAPE_CHOICES,
+    SHAPE_CUM_WEIGHTS,
+    THEME_CHOICES,
+    THEME_CUM_WEIGHTS,
+    EXIT_COUNTS,
+    ONE_EXIT_ROOMS,
+    DungeonConfig,
+    DEFAULT_CONFIG,
+    derive_seed,
+)
+
+class CachedDungeon(NamedTuple):
+    dungeon_map: array[uint8]
+    tilemap: array[uint8]
+    theme_map: array[uint8]
+
+class _Layout(NamedTuple):
+    dungeon_map: array[uint8]
+    tilemap: array[uint8]
+    theme_map: array[uint8]
+    template_map: array[np.int16]
+    np_rng: np.random.Generator
+
+def _layout_fingerprint(vectorized: bool, config: DungeonConfig) -> str:
+    digest = blake2b(digest_size = 8)
+    digest.update(repr((astuple(config), vectorized)).encode("utf-8"))
+    templates = Stage_2.room_templates(config.room_size)
+    tables = (
+        SHAPE_CHOICES,
+        SHAPE_CUM_WEIGHTS,
+        THEME_CHOICES,
+        THEME_CUM_WEIGHTS,
+        EXIT_COUNTS,
+        np.array(ONE_EXIT_ROOMS, dtype = np.int64),
+        templates
+    )
+    for table in tables:
+        digest.update(np.ascontiguousarray(table).tobytes())
+    return digest.hexdigest()
+
+def _build_layout(seed: int, vectorized: bool, config: DungeonConfig) -> _Layout:
+    np_rng = np.random.default_rng(seed)
+    rand_rng = Random(seed)
+    dungeon_map = Stage_1.map_generator(np_rng, rand_rng, vectorized, config = config)
+    template_map = np.empty(dungeon_map.shape, dtype = np.int16)
+    tilemap, theme_map = Stage_2.tilemap_builder(
+        dungeon_map, np_rng, rand_rng, template_map, config = config
+    )
+    return _Layout(dungeon_map, tilemap, theme_map, template_map, np_rng)
+
+def _freeze(*arrays: array) -> None:
+    for item in arrays:
+        item.flags.writeable = False
+    return
+
+class DungeonCache:
+    def __init__(
+            self,
+            max_bytes: int = 256 * 1024 * 1024,
+            directory: str | os.PathLike | None = None,
+            vectorized: bool = False,
+            config: DungeonConfig = DEFAULT_CONFIG
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.vectorized = vectorized
+        self.config = config
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, CachedDungeon] = OrderedDict()
+        self._fingerprint = _layout_fingerprint(vectorized, config)
+        if directory is not None:
+            os.makedirs(directory, exist_ok = True)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, seed: int | str) -> bool:
+        return derive_seed(seed) in self._entries
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.nbytes = 0
+        return
+
+    def get(self, seed: int | str | None) -> CachedDungeon:
+        seed = derive_seed(seed)
+        if seed is None:
+            return self._generate(np.random.SeedSequence().entropy, persist = False)
+        entry = self._entries.get(seed)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(seed)
+            return entry
+        entry = self._generate(seed)
+        _freeze(*entry)
+        self._insert(seed, entry)
+        return entry
+
+    def _insert(self, seed: int, entry: CachedDungeon) -> None:
+        size = sum(item.nbytes for item in entry)
+        if size > self.max_bytes:
+            return
+        self._entries[seed] = entry
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last = False)
+            self.nbytes -= sum(item.nbytes for item in evicted)
+        return
+
+    def _layout_path(self, seed: int) -> str:
+        return os.path.join(self.directory, f"{self._fingerprint}_{seed}.npz")
+
+    def _load_layout(self, seed: int) -> _Layout | None:
+        if self.directory is None:
+            return None
+        try:
+            with np.load(self._layout_path(seed)) as stored:
+                np_rng = np.random.default_rng()
+                np_rng.bit_generator.state = json.loads(str(stored["rng_state"]))
+                return _Layout(
+                    stored["dungeon_map"],
+                    stored["tilemap"],
+                    stored["theme_map"],
+                    stored["template_map"],
+                    np_rng
+                )
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _store_layout(self, seed: int, layout: _Layout) -> None:
+        path = self._layout_path(seed)
+        partial_path = f"{path}.{os.getpid()}.tmp"
+        with open(partial_path, "wb") as f:
+            np.savez(
+                f,
+                dungeon_map = layout.dungeon_map,
+                tilemap = layout.tilemap,
+                theme_map = layout.theme_map,
+                template_map = layout.template_map,
+                rng_state = np.array(json.dumps(layout.np_rng.bit_generator.state))
+            )
+        os.replace(partial_path, path)
+        return
+
+    def _generate(self, seed: int, persist: bool = True) -> CachedDungeon:
+        layout = self._load_layout(seed) if persist else None
+        if layout is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            layout = _build_layout(seed, self.vectorized, self.config)
+            if persist and self.directory is not None:
+                self._store_layout(seed, layout)
+        tilemap = Stage_3.room_populator(
+            layout.tilemap, layout.theme_map, layout.np_rng,
+            self.vectorized, layout.template_map, config = self.config
+        )
+        return CachedDungeon(layout.dungeon_map, tilemap, layout.theme_map)
@@ -0,0 +1,144 @@
+import struct
+from time import perf_counter
+from typing import NamedTuple, Sequence
+
+import numpy as np
+from numpy import uint8
+from numpy.typing import NDArray as array
+
+from Gen_Helpers import Theme
+
+MAGIC = b"DGN2"
+LAYOUT_BITS = 5
+THEME_BITS = 6
+_HEADER = struct.Struct("<4s4IBHIII")
+
+class CodecReport(NamedTuple):
+    raw_bytes: int
+    encoded_bytes: int
+    ratio: float
+    encode_mb_s: float
+    decode_mb_s: float
+
+def pack_bits(values: array[uint8], bits: int) -> bytes:
+    flat = np.ascontiguousarray(values, dtype = uint8).reshape(-1, 1)
+    if flat.size and int(flat.max()) >> bits:
+        raise ValueError(f"pack_bits got a value that does not fit in {bits} bits.")
+    planes = np.unpackbits(flat, axis = 1, bitorder = "little")[:, :bits]
+    return np.packbits(planes, bitorder = "little").tobytes()
+
+def unpack_bits(data: bytes | memoryview, bits: int, count: int) -> array[uint8]:
+    packed = np.frombuffer(data, dtype = uint8)
+    planes = np.zeros((count, 8), dtype = uint8)
+    planes[:, :bits] = np.unpackbits(
+        packed, count = count * bits, bitorder = "little"
+    ).reshape(count, bits)
+    return np.packbits(planes, axis = 1, bitorder = "little").ravel()
+
+def _packed_size(bits: int, count: int) -> int:
+    return (bits * count + 7) // 8
+
+def _encode_varints(values: array[np.int64]) -> bytes:
+    widths = np.maximum(1, (np.log2(values | 1).astype(np.int64) + 7) // 7)
+    ends = np.cumsum(widths)
+    owner = np.repeat(np.arange(values.size), widths)
+    place = np.arange(owner.size) - (ends - widths)[owner]
+    out = ((values[owner] >> (7 * place)) & 0x7F).astype(uint8)
+    out[place < widths[owner] - 1] |= 0x80
+    return out.tobytes()
+
+def _decode_varints(data: bytes | memoryview) -> array[np.int64]:
+    raw = np.frombuffer(data, dtype = uint8)
+    ends = np.flatnonzero(raw < 0x80)
+    starts = np.r_[0, ends[:-1] + 1]
+    owner = np.repeat(np.arange(ends.size), ends - starts + 1)
+    place = np.arange(raw.size) - starts[owner]
+    parts = (raw & 0x7F).astype(np.int64) << (7 * place)
+    return np.add.reduceat(parts, starts) if ends.size else parts
+
+def _runs(flat: array[uint8]) -> tuple[array[uint8], array[np.int64]]:
+    starts = np.flatnonzero(np.r_[True, flat[1:] != flat[:-1]])
+    lengths = np.diff(np.r_[starts, flat.size])
+    return flat[starts], lengths
+
+def encode_dungeon(
+        tilemap: array[uint8],
+        theme_map: array[uint8],
+        dungeon_map: array[uint8] | None = None
+) -> bytes:
+    if len(Theme) > 1 << THEME_BITS:
+        raise ValueError(f"Theme ids no longer fit in {THEME_BITS} bits.")
+    palette, indices = np.unique(tilemap, return_inverse = True)
+    palette_bits = max(1, (len(palette) - 1).bit_length())
+    run_values, run_lengths = _runs(indices.astype(uint8).ravel())
+    theme_bytes = pack_bits(theme_map, THEME_BITS)
+    layout_bytes = b"" if dungeon_map is None else pack_bits(dungeon_map, LAYOUT_BITS)
+    value_bytes = pack_bits(run_values, palette_bits)
+    length_bytes = _encode_varints(run_lengths)
+    header = _HEADER.pack(
+        MAGIC,
+        *theme_map.shape,
+        *tilemap.shape,
+        dungeon_map is not None,
+        len(palette),
+        run_values.size,
+        len(value_bytes),
+        len(length_bytes)
+    )
+    return b"".join((
+        header, theme_bytes, layout_bytes, palette.tobytes(), value_bytes, length_bytes
+    ))
+
+def decode_dungeon(
+        data: bytes | memoryview
+) -> tuple[array[uint8], array[uint8], array[uint8] | None]:
+    view = memoryview(data)
+    (
+        magic, theme_h, theme_w, tile_h, tile_w, has_layout,
+        palette_size, run_count, value_size, length_size
+    ) = _HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError(f"decode_dungeon got an unknown header {magic!r}.")
+    offset = _HEADER.size
+    theme_count = theme_h * theme_w
+    theme_size = _packed_size(THEME_BITS, theme_count)
+    theme_map = unpack_bits(view[offset:offset + theme_size], THEME_BITS, theme_count)
+    offset += theme_size
+    dungeon_map = None
+    if has_layout:
+        layout_size = _packed_size(LAYOUT_BITS, theme_count)
+        dungeon_map = unpack_bits(
+            view[offset:offset + layout_size], LAYOUT_BITS, theme_count
+        ).reshape(theme_h, theme_w)
+        offset += layout_size
+    palette = np.frombuffer(view[offset:offset + palette_size], dtype = uint8)
+    offset += palette_size
+    palette_bits = max(1, (palette_size - 1).bit_length())
+    run_values = unpack_bits(view[offset:offset + value_size], palette_bits, run_count)
+    offset += value_size
+    run_lengths = _decode_varints(view[offset:offset + length_size])
+    tilemap = np.repeat(palette[run_values], run_lengths).reshape(tile_h, tile_w)
+    return tilemap, theme_map.reshape(theme_h, theme_w), dungeon_map
+
+def measure_codec(
+        dungeons: Sequence[tuple[array[uint8], array[uint8], array[uint8] | None]]
+) -> CodecReport:
+    raw = sum(
+        sum(part.nbytes for part in dungeon if part is not None) for dungeon in dungeons
+    )
+    start = perf_counter()
+    blobs = [encode_dungeon(*dungeon) for dungeon in dungeons]
+    encode_seconds = perf_counter() - start
+    start = perf_counter()
+    for blob in blobs:
+        decode_dungeon(blob)
+    decode_seconds = perf_counter() - start
+    encoded = sum(len(blob) for blob in blobs)
+    megabytes = raw / 1e6
+    return CodecReport(
+        raw,
+        encoded,
+        raw / encoded if encoded else 0.0,
+        megabytes / encode_seconds if encode_seconds > 0 else 0.0,
+        megabytes / decode_seconds if decode_seconds > 0 else 0.0
+    )
@@ -0,0 +1,101 @@
+import numpy as np
+from numpy import uint8
+from numpy.typing import NDArray as array
+
+from Debug import timeit
+
+def _edges(dungeon_map: array[uint8]) -> tuple[array[np.intp], array[np.intp]]:
+    index = np.arange(dungeon_map.size).reshape(dungeon_map.shape)
+    east = (
+        ((dungeon_map[..., :, :-1] & 0b0010) != 0)
+        | ((dungeon_map[..., :, 1:] & 0b1000) != 0)
+    )
+    south = (
+        ((dungeon_map[..., :-1, :] & 0b0100) != 0)
+        | ((dungeon_map[..., 1:, :] & 0b0001) != 0)
+    )
+    src = np.concatenate((index[..., :, :-1][east], index[..., :-1, :][south]))
+    dst = np.concatenate((index[..., :, 1:][east], index[..., 1:, :][south]))
+    return src, dst
+
+@timeit
+def _find_roots(dungeon_map: array[uint8]) -> array[np.intp]:
+    src, dst = _edges(dungeon_map)
+    parent = np.arange(dungeon_map.size)
+    while True:
+        src_root = parent[src]
+        dst_root = parent[dst]
+        changed = src_root != dst_root
+        if not changed.any():
+            break
+        low = np.minimum(src_root[changed], dst_root[changed])
+        high = np.maximum(src_root[changed], dst_root[changed])
+        np.minimum.at(parent, high, low)
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+    return parent
+
+@timeit
+def label_rooms(
+        dungeon_map: array[uint8]
+) -> tuple[array[np.int32], array[np.intp]]:
+    roots = _find_roots(dungeon_map)
+    active = (dungeon_map != 0).ravel()
+    _, component = np.unique(roots[active], return_inverse = True)
+    labels = np.zeros(dungeon_map.size, dtype = np.int32)
+    labels[active] = component + 1
+    sizes = np.bincount(labels)
+    sizes[0] = 0
+    return labels.reshape(dungeon_map.shape), sizes
+
+def _first_in_set_order(
+        dungeon_map: array[uint8],
+        labels: array[np.int32],
+        tied: array[np.intp],
+        label_count: int
+) -> int:
+    positions = np.zeros(dungeon_map.shape, dtype = np.intp)
+    # Ties go to the group the old set-walking BFS reached first.
+    cells = {(r, c) for r, c in np.argwhere(dungeon_map != 0).tolist()}
+    for position, (r, c) in enumerate(cells.copy()):
+        positions[r, c] = position
+    active = labels != 0
+    first = np.full(label_count, positions.size, dtype = np.intp)
+    np.minimum.at(first, labels[active], positions[active])
+    return int(tied[np.argmin(first[tied])])
+
+@timeit
+def largest_component(dungeon_map: array[uint8]) -> array[np.bool_]:
+    labels, sizes = label_rooms(dungeon_map)
+    if dungeon_map.ndim == 2:
+        tied = np.flatnonzero(sizes == sizes.max())
+        leader = int(tied[0])
+        if tied.size > 1:
+            leader = _first_in_set_order(dungeon_map, labels, tied, sizes.size)
+        return (labels == leader) & (labels != 0)
+    if sizes.size == 1:
+        return np.zeros(dungeon_map.shape, dtype = np.bool_)
+    h, w = dungeon_map.shape[-2:]
+    flat_labels = labels.reshape(-1, h * w)
+    label_slice = np.zeros(sizes.size, dtype = np.intp)
+    label_slice[flat_labels] = np.arange(flat_labels.shape[0])[:, np.newaxis]
+    component_slice = label_slice[1:]
+    order = np.lexsort((-sizes[1:], component_slice))
+    ordered_slice = component_slice[order]
+    leaders = order[np.r_[True, ordered_slice[1:] != ordered_slice[:-1]]]
+    keep = np.zeros(sizes.size, dtype = np.bool_)
+    keep[leaders + 1] = True
+    leader_sizes = np.zeros(flat_labels.shape[0], dtype = np.intp)
+    leader_sizes[component_slice[leaders]] = sizes[leaders + 1]
+    tied = sizes[1:] == leader_sizes[component_slice]
+    tie_counts = np.bincount(component_slice[tied], minlength = leader_sizes.size)
+    for index in np.flatnonzero(tie_counts > 1).tolist():
+        slice_tied = np.flatnonzero(tied & (component_slice == index)) + 1
+        keep[slice_tied] = False
+        keep[_first_in_set_order(
+            dungeon_map[index], labels.reshape(-1, h, w)[index], slice_tied, sizes.size
+        )] = True
+    return keep[labels]
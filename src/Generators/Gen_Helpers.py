@@ -1,6 +1,12 @@
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
 
+from dataclasses import dataclass, fields
 from enum import IntEnum, auto
+from functools import cache
+from hashlib import blake2b
+from itertools import combinations
+from numbers import Integral
 
 class Shape(IntEnum):
     DEAD_END = 0
@@ -82,6 +88,8 @@ class Theme(IntEnum):
 class Const(IntEnum):
     ROOM_SIZE = 17
     HALF = ROOM_SIZE//2
+    DEAD_END_MIN = 2
+    DEAD_END_MAX = 5
 
 class Tile(IntEnum):
     WALL = 0
@@ -118,6 +126,51 @@ class S1_Const(IntEnum):
 class InvalidRoom(Exception):
     pass
 
+ROOM_CHUNK = 1 << 16
+
+@dataclass(frozen = True)
+class DungeonConfig:
+    dungeon_size: int = S1_Const.DUNGEON_SIZE
+    room_size: int = Const.ROOM_SIZE
+    box_count: int = S1_Const.BOX_COUNT
+    erode_count: int = S1_Const.ERODE_COUNT
+
+    def __post_init__(self) -> None:
+        for field in fields(self):
+            object.__setattr__(self, field.name, int(getattr(self, field.name)))
+        if self.dungeon_size < 8:
+            raise ValueError(
+                f"DungeonConfig needs dungeon_size >= 8, got {self.dungeon_size}."
+            )
+        if self.room_size < 15:
+            raise ValueError(
+                f"DungeonConfig needs room_size >= 15, got {self.room_size}."
+            )
+        if self.box_count < 1 or self.erode_count < 0:
+            raise ValueError(
+                f"DungeonConfig needs box_count >= 1 and erode_count >= 0, "
+                f"got {self.box_count} and {self.erode_count}."
+            )
+
+    @property
+    def mid(self) -> int:
+        return self.dungeon_size // 2
+
+    @property
+    def half(self) -> int:
+        return self.room_size // 2
+
+    @property
+    def theme_shape(self) -> tuple[int, int]:
+        return self.dungeon_size, self.dungeon_size
+
+    @property
+    def tilemap_shape(self) -> tuple[int, int]:
+        size = self.dungeon_size * self.room_size
+        return size, size
+
+DEFAULT_CONFIG = DungeonConfig()
+
 SHAPE_TABLES: dict[int, tuple[list[Shape], list[float]]] = {
     1: (
         [Shape.DEAD_END, Shape.BOSS_ROOM, Shape.SMALL_ROOM, Shape.SMALL_CIRCLE, Shape.LARGE_CIRCLE],
@@ -185,6 +238,21 @@ THEME_TABLES: dict[Shape, tuple[list[Theme], list[float]]] = {
     ),
 }
 
+def _compile_choice_table(
+        tables: dict[int, tuple[list[Shape], list[float]]] | dict[Shape, tuple[list[Theme], list[float]]]
+) -> tuple[np.ndarray, np.ndarray]:
+    rows = max(tables) + 1
+    width = max(len(options) for options, _ in tables.values())
+    choices = np.zeros((rows, width), dtype = np.uint8)
+    cum_weights = np.full((rows, width), np.inf)
+    for key, (options, weights) in tables.items():
+        choices[key, :len(options)] = options
+        cum_weights[key, :len(weights)] = np.cumsum(weights)
+    return choices, cum_weights
+
+SHAPE_CHOICES, SHAPE_CUM_WEIGHTS = _compile_choice_table(SHAPE_TABLES)
+THEME_CHOICES, THEME_CUM_WEIGHTS = _compile_choice_table(THEME_TABLES)
+
 POPULATION_TABLES: dict[Theme, dict[Tile, int | tuple[int, int]]] = {
     Theme.DE_TRAPPED:  {Tile.HOLE: 1, Tile.WATER: (0,1), Tile.TRAP: 3},
     Theme.DE_TREASURE: {Tile.TRAP: 1, Tile.CHEST: 1, Tile.LOOT_PILE: 2, Tile.MONSTER_SPAWNER: 1},
@@ -266,6 +334,30 @@ FEATURE_ORDER = (
         Tile.MONSTER_SPAWNER
     )
 
+def _compile_population_tables() -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    feature_index = {feature: i for i, feature in enumerate(FEATURE_ORDER)}
+    shape = (len(Theme), len(FEATURE_ORDER))
+    minimums = np.zeros(shape, dtype = np.int32)
+    maximums = np.zeros(shape, dtype = np.int32)
+    ranged_width = max(
+        sum(isinstance(count, tuple) for count in table.values())
+        for table in POPULATION_TABLES.values()
+    )
+    ranged = np.full((len(Theme), ranged_width), -1, dtype = np.intp)
+    for theme, table in POPULATION_TABLES.items():
+        slot = 0
+        for feature, count in table.items():
+            column = feature_index[feature]
+            if isinstance(count, tuple):
+                minimums[theme, column], maximums[theme, column] = count
+                ranged[theme, slot] = column
+                slot += 1
+            else:
+                minimums[theme, column] = maximums[theme, column] = count
+    return minimums, maximums, ranged
+
+POPULATION_MIN, POPULATION_MAX, POPULATION_RANGED = _compile_population_tables()
+
 SCAN_PARAMS: dict[Tile, dict[str, set[Tile]]] = {
     Tile.ENTRANCE:         {"require": {Tile.FLOOR}, "place_on": {Tile.WALL}},
     Tile.WATER:            {"block": {Tile.CHEST, Tile.LOOT_PILE, Tile.HOLE}},
@@ -281,17 +373,105 @@ SCAN_PARAMS: dict[Tile, dict[str, set[Tile]]] = {
     Tile.MONSTER_SPAWNER:  {"block": {Tile.BOSS_SPAWNER, Tile.HEALING_STATION, Tile.SHRINE}}
     }
 
+def _tile_bits(tiles: set[Tile]) -> int:
+    return sum(1 << tile for tile in tiles)
+
+SCAN_MASKS: dict[Tile, dict[str, int]] = {
+    feature: {"place_on": _tile_bits({Tile.FLOOR})} | {
+        param: _tile_bits(tiles) for param, tiles in params.items()
+    }
+    for feature, params in SCAN_PARAMS.items()
+}
+
 DUPLICATES: dict[Tile, Tile] = {
     Tile.WATER_POOL: Tile.WATER,
     Tile.LOOT_CLUSTER: Tile.LOOT_PILE
 }
 
-_ROOM_Y, _ROOM_X = np.ogrid[:Const.ROOM_SIZE, :Const.ROOM_SIZE]
-SMALL_CIRCLE_MASK = (
-    (_ROOM_Y - Const.HALF) ** 2 + (_ROOM_X - Const.HALF) ** 2 <= 3 ** 2
-)
-LARGE_CIRCLE_MASK = (
-    (_ROOM_Y - Const.HALF) ** 2 + (_ROOM_X - Const.HALF) ** 2 <= 6 ** 2
+@cache
+def circle_masks(room_size: int) -> tuple[np.ndarray, np.ndarray]:
+    half = room_size // 2
+    room_y, room_x = np.ogrid[:room_size, :room_size]
+    distance = (room_y - half) ** 2 + (room_x - half) ** 2
+    small, large = distance <= 3 ** 2, distance <= 6 ** 2
+    small.flags.writeable = large.flags.writeable = False
+    return small, large
+
+SMALL_CIRCLE_MASK, LARGE_CIRCLE_MASK = circle_masks(Const.ROOM_SIZE)
+
+ONE_EXIT_ROOMS = [17, 18, 20, 24]
+
+EXIT_COUNTS = np.array([mask.bit_count() for mask in range(16)], dtype = np.uint8)
+
+MASK_TO_INDICES = tuple(
+    tuple(i for i in range(4) if mask & (1 << i))
+    for mask in range(16)
 )
 
-ONE_EXIT_ROOMS = [17, 18, 20, 24]
\ No newline at end of file
+def _build_connection_subsets() -> tuple[np.ndarray, np.ndarray]:
+    subsets = np.zeros((16, 4, 6), dtype = np.uint8)
+    subset_counts = np.ones((16, 4), dtype = np.uint8)
+    for mask, indices in enumerate(MASK_TO_INDICES):
+        for count in range(1, 4):
+            if count >= len(indices):
+                subsets[mask, count, 0] = mask
+                continue
+            options = [
+                sum(1 << i for i in chosen)
+                for chosen in combinations(indices, count)
+            ]
+            subsets[mask, count, :len(options)] = options
+            subset_counts[mask, count] = len(options)
+    return subsets, subset_counts
+
+CONNECTION_SUBSETS, CONNECTION_SUBSET_COUNTS = _build_connection_subsets()
+
+def room_major_view(tilemap: np.ndarray, rs: int = Const.ROOM_SIZE) -> np.ndarray:
+    if tilemap.ndim == 4:
+        return tilemap
+    h, w = tilemap.shape[0] // rs, tilemap.shape[1] // rs
+    row_stride, col_stride = tilemap.strides
+    return as_strided(
+        tilemap,
+        shape = (h, w, rs, rs),
+        strides = (row_stride * rs, col_stride * rs, row_stride, col_stride)
+    )
+
+def to_room_major(tilemap: np.ndarray, rs: int = Const.ROOM_SIZE) -> np.ndarray:
+    return np.ascontiguousarray(room_major_view(tilemap, rs))
+
+def from_room_major(rooms: np.ndarray) -> np.ndarray:
+    h, w, rs, _ = rooms.shape
+    return rooms.transpose(0, 2, 1, 3).reshape(h * rs, w * rs)
+
+def derive_seed(seed: int | str | None) -> int | None:
+    if seed is None:
+        return seed
+    if isinstance(seed, Integral):
+        return int(seed)
+    if not isinstance(seed, str):
+        raise TypeError(f"derive_seed needs an int or str seed, got {type(seed).__name__}.")
+    if seed.isdigit():
+        return int(seed)
+    digest = blake2b(seed.encode("utf-8"), digest_size = 8).digest()
+    return int.from_bytes(digest, "little")
+
+_SPLITMIX_STEP = np.uint64(0x9E3779B97F4A7C15)
+_SPLITMIX_MUL_1 = np.uint64(0xBF58476D1CE4E5B9)
+_SPLITMIX_MUL_2 = np.uint64(0x94D049BB133111EB)
+
+def seed_key(seed: int) -> np.uint64:
+    return np.random.SeedSequence(seed).generate_state(1, np.uint64)[0]
+
+def mix_keys(keys: np.ndarray, *salts: int | np.ndarray) -> np.ndarray:
+    keys = np.asarray(keys, dtype = np.uint64)
+    for salt in salts:
+        keys = keys ^ np.asarray(salt, dtype = np.uint64)
+        keys = keys + _SPLITMIX_STEP
+        keys = (keys ^ (keys >> np.uint64(30))) * _SPLITMIX_MUL_1
+        keys = (keys ^ (keys >> np.uint64(27))) * _SPLITMIX_MUL_2
+        keys = keys ^ (keys >> np.uint64(31))
+    return keys
+
+def key_uniforms(keys: np.ndarray) -> np.ndarray:
+    return (keys >> np.uint64(11)) * (1.0 / (1 << 53))
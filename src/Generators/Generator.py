@@ -1,13 +1,222 @@
+import os
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from itertools import islice
 from random import Random
+from time import perf_counter
+from typing import NamedTuple
 
 import numpy as np
+from numpy import uint8
+from numpy.typing import NDArray as array
 
 import Stage_1, Stage_2, Stage_3
+from Acceptance import AcceptanceCriteria, RejectionStats
+from Gen_Helpers import DungeonConfig, DEFAULT_CONFIG
+from Sparse import BlockSparseTilemap
 
-def generate_dungeon(seed: int | None = None):
+class BatchResult(NamedTuple):
+    dungeons: list[tuple[array[uint8] | BlockSparseTilemap, array[uint8]]]
+    seconds: float
+    rate: float
+
+def _build_downstream(
+        dungeon_map: array[uint8],
+        np_rng: np.random.Generator,
+        rand_rng: Random,
+        vectorized: bool = False,
+        config: DungeonConfig = DEFAULT_CONFIG,
+        sparse: bool = False,
+        room_major: bool = False
+) -> tuple[array[uint8] | BlockSparseTilemap, array[uint8]]:
+    template_map = np.empty(dungeon_map.shape, dtype = np.int16)
+    tilemap, theme_map = Stage_2.tilemap_builder(
+        dungeon_map, np_rng, rand_rng, template_map,
+        config = config, sparse = sparse, room_major = room_major
+    )
+    tilemap = Stage_3.room_populator(
+        tilemap, theme_map, np_rng, vectorized, template_map, config = config
+    )
+    return tilemap, theme_map
+
+def generate_dungeon(
+        seed: int | None = None,
+        vectorized: bool = False,
+        config: DungeonConfig = DEFAULT_CONFIG,
+        sparse: bool = False,
+        room_major: bool = False
+) -> tuple[array[uint8] | BlockSparseTilemap, array[uint8]]:
     np_rng = np.random.default_rng(seed)
     rand_rng = Random(seed)
-    dungeon_map = Stage_1.map_generator(np_rng, rand_rng)
-    tilemap, theme_map = Stage_2.tilemap_builder(dungeon_map, np_rng, rand_rng)
-    tilemap = Stage_3.room_populator(tilemap, theme_map, np_rng)
-    return tilemap, theme_map
\ No newline at end of file
+    dungeon_map = Stage_1.map_generator(np_rng, rand_rng, vectorized, config = config)
+    return _build_downstream(
+        dungeon_map, np_rng, rand_rng, vectorized, config, sparse, room_major
+    )
+
+def iter_dungeons(
+        seed_source: Iterable[int | None],
+        prefetch: int = 4,
+        workers: int | None = None,
+        vectorized: bool = False,
+        config: DungeonConfig = DEFAULT_CONFIG,
+        sparse: bool = False
+) -> Iterator[tuple[array[uint8] | BlockSparseTilemap, array[uint8]]]:
+    if prefetch < 1:
+        raise ValueError(f"iter_dungeons needs prefetch >= 1, got {prefetch}.")
+    generate = partial(
+        generate_dungeon, vectorized = vectorized, config = config, sparse = sparse
+    )
+    seeds = iter(seed_source)
+    workers = workers or min(prefetch, os.cpu_count() or 1)
+    pool = ProcessPoolExecutor(max_workers = workers)
+    pending: deque[Future[tuple[array[uint8], array[uint8]]]] = deque()
+    try:
+        for seed in islice(seeds, prefetch):
+            pending.append(pool.submit(generate, seed))
+        while pending:
+            dungeon = pending.popleft().result()
+            for seed in islice(seeds, 1):
+                pending.append(pool.submit(generate, seed))
+            yield dungeon
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait = True, cancel_futures = True)
+
+class DungeonGenerator:
+    def __init__(
+            self,
+            vectorized: bool = False,
+            config: DungeonConfig = DEFAULT_CONFIG
+    ) -> None:
+        self.vectorized = vectorized
+        self.config = config
+        self.theme_shape = config.theme_shape
+        self.tilemap_shape = config.tilemap_shape
+        self._layout = np.empty(self.theme_shape, dtype = uint8)
+        self._neighbor_map = np.empty(self.theme_shape, dtype = uint8)
+        self._template_map = np.empty(self.theme_shape, dtype = np.int16)
+        self._bit_map = np.empty((config.room_size, config.room_size), dtype = np.uint32)
+
+    def empty_outputs(self) -> tuple[array[uint8], array[uint8]]:
+        return (
+            np.empty(self.tilemap_shape, dtype = uint8),
+            np.empty(self.theme_shape, dtype = uint8)
+        )
+
+    def generate_into(
+            self,
+            out_tilemap: array[uint8],
+            out_theme_map: array[uint8],
+            seed: int | None = None
+    ) -> tuple[array[uint8], array[uint8]]:
+        too_small = any(
+            have < need
+            for out, shape in (
+                (out_tilemap, self.tilemap_shape), (out_theme_map, self.theme_shape)
+            )
+            for have, need in zip(out.shape, shape)
+        )
+        if too_small or out_tilemap.ndim != 2 or out_theme_map.ndim != 2:
+            raise ValueError(
+                f"generate_into needs outputs of at least {self.tilemap_shape} "
+                f"and {self.theme_shape}, got {out_tilemap.shape} and {out_theme_map.shape}."
+            )
+        np_rng = np.random.default_rng(seed)
+        rand_rng = Random(seed)
+        dungeon_map = Stage_1.map_generator(
+            np_rng, rand_rng, self.vectorized, self._layout, self._neighbor_map,
+            self.config
+        )
+        h, w = dungeon_map.shape
+        rs = self.config.room_size
+        tilemap = out_tilemap[:h * rs, :w * rs]
+        theme_map = out_theme_map[:h, :w]
+        template_map = self._template_map[:h, :w]
+        Stage_2.tilemap_builder(
+            dungeon_map, np_rng, rand_rng, template_map, tilemap, theme_map,
+            self.config
+        )
+        Stage_3.room_populator(
+            tilemap, theme_map, np_rng, self.vectorized, template_map,
+            self._bit_map, self.config
+        )
+        return tilemap, theme_map
+
+def generate_layouts(
+        seeds: Iterable[int | None],
+        vectorized: bool = False,
+        config: DungeonConfig = DEFAULT_CONFIG
+) -> list[array[uint8]]:
+    seeds = list(seeds)
+    np_rngs = [np.random.default_rng(seed) for seed in seeds]
+    rand_rngs = [Random(seed) for seed in seeds]
+    return Stage_1.map_generator_batch(np_rngs, rand_rngs, vectorized, config)
+
+def generate_dungeons(
+        seeds: Iterable[int | None],
+        workers: int | None = None,
+        chunksize: int | None = None,
+        vectorized: bool = False,
+        config: DungeonConfig = DEFAULT_CONFIG,
+        sparse: bool = False
+) -> BatchResult:
+    seeds = list(seeds)
+    generate = partial(
+        generate_dungeon, vectorized = vectorized, config = config, sparse = sparse
+    )
+    workers = workers or os.cpu_count() or 1
+    start = perf_counter()
+    if workers == 1:
+        dungeons = [generate(seed) for seed in seeds]
+    else:
+        chunksize = chunksize or max(1, len(seeds) // (workers * 4))
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            dungeons = list(pool.map(generate, seeds, chunksize = chunksize))
+    seconds = perf_counter() - start
+    rate = len(seeds) / seconds if seconds > 0 else 0.0
+    return BatchResult(dungeons, seconds, rate)
+
+def retry_seed(seed: int | None, attempt: int) -> int | None:
+    if seed is None:
+        return None
+    state = np.random.SeedSequence(seed, spawn_key = (attempt,)).generate_state(1, np.uint64)
+    return int(state[0])
+
+def generate_accepted(
+        seed_source: Iterable[int | None],
+        criteria: AcceptanceCriteria,
+        stats: RejectionStats | None = None,
+        max_retries: int = 0,
+        vectorized: bool = False,
+        config: DungeonConfig = DEFAULT_CONFIG
+) -> Iterator[tuple[int | None, array[uint8], array[uint8]]]:
+    if stats is None:
+        stats = RejectionStats()
+    for source_seed in seed_source:
+        for attempt in range(max_retries + 1):
+            seed = source_seed if attempt == 0 else retry_seed(source_seed, attempt)
+            start = perf_counter()
+            np_rng = np.random.default_rng(seed)
+            rand_rng = Random(seed)
+            dungeon_map = Stage_1.map_generator(
+                np_rng, rand_rng, vectorized, config = config
+            )
+            reason = criteria.rejects(dungeon_map)
+            stage_1_end = perf_counter()
+            stats.attempts += 1
+            stats.stage_1_seconds += stage_1_end - start
+            if reason is not None:
+                stats.record_rejection(reason)
+                continue
+            tilemap, theme_map = _build_downstream(
+                dungeon_map, np_rng, rand_rng, vectorized, config
+            )
+            stats.downstream_seconds += perf_counter() - stage_1_end
+            stats.accepted += 1
+            yield seed, tilemap, theme_map
+            break
+        else:
+            stats.skipped_seeds += 1
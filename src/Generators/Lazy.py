@@ -0,0 +1,170 @@
+from concurrent.futures import ThreadPoolExecutor
+from random import Random
+
+import numpy as np
+from numpy import uint8
+from numpy.typing import NDArray as array
+
+import Stage_1, Stage_2, Stage_3
+from Gen_Helpers import (
+    Tile,
+    DungeonConfig,
+    DEFAULT_CONFIG,
+    seed_key,
+    mix_keys,
+    key_uniforms,
+)
+from Sparse import BlockSparseTilemap
+
+PLAN_STREAM = 0
+POPULATE_STREAM = 1
+
+class LazyDungeon:
+    def __init__(
+            self,
+            seed: int | None = None,
+            config: DungeonConfig = DEFAULT_CONFIG,
+            room_streams: bool = False,
+            threads: int = 1
+    ) -> None:
+        if threads > 1 and not room_streams:
+            raise ValueError("LazyDungeon needs room_streams=True to use threads.")
+        if seed is None and room_streams:
+            seed = int(np.random.SeedSequence().entropy)
+        np_rng = np.random.default_rng(seed)
+        rand_rng = Random(seed)
+        self.seed = seed
+        self.config = config
+        self.room_streams = room_streams
+        self.threads = threads
+        self.dungeon_map = Stage_1.map_generator(np_rng, rand_rng, config = config)
+        self._rerolls = np.zeros(self.dungeon_map.shape, dtype = np.uint32)
+        if room_streams:
+            self._seed_key = seed_key(seed)
+            self.entrance = Stage_2.get_entrance_room(self.dungeon_map, rand_rng)
+            self.template_map = np.full(self.dungeon_map.shape, -1, dtype = np.int16)
+            self.theme_map = np.zeros(self.dungeon_map.shape, dtype = uint8)
+            self._plan(np.argwhere(self.dungeon_map))
+            self.rooms = np.argwhere(self.theme_map != 0)
+            self._counts = None
+        else:
+            self.template_map, self.theme_map = Stage_2.plan_rooms(
+                self.dungeon_map, np_rng, rand_rng
+            )
+            self.rooms, counts = Stage_3.resolve_counts(self.theme_map, np_rng)
+            self._counts = counts.tolist()
+        self._np_rng = np_rng
+        self._tiles = BlockSparseTilemap(self.theme_map != 0, config.room_size)
+        self._ready = np.zeros(len(self.rooms), dtype = np.bool_)
+        self._prefix = 0
+        self._templates = Stage_2.room_templates(config.room_size)
+        self._bit_map = np.empty((config.room_size, config.room_size), dtype = np.uint32)
+        self._empty_room = np.full(
+            (config.room_size, config.room_size), Tile.WALL, dtype = uint8
+        )
+        self._empty_room.flags.writeable = False
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self._tiles.shape
+
+    @property
+    def materialized(self) -> int:
+        return int(np.count_nonzero(self._ready))
+
+    def __len__(self) -> int:
+        return len(self.rooms)
+
+    def room_keys(self, rooms: array[np.intp], stream: int) -> array[np.uint64]:
+        rows, cols = rooms[:, 0], rooms[:, 1]
+        keys = np.full(len(rooms), self._seed_key)
+        return mix_keys(keys, rows, cols, self._rerolls[rows, cols], stream)
+
+    def _plan(self, cells: array[np.intp]) -> None:
+        rows, cols = cells[:, 0], cells[:, 1]
+        keys = self.room_keys(cells, PLAN_STREAM)
+        draws = key_uniforms(mix_keys(keys[:, np.newaxis], np.arange(3)))
+        entrance = (rows == self.entrance[0]) & (cols == self.entrance[1])
+        template_ids, themes = Stage_2.plan_cells(
+            self.dungeon_map[rows, cols], draws, entrance
+        )
+        self.template_map[rows, cols] = template_ids
+        self.theme_map[rows, cols] = themes
+        return
+
+    def _run_partitions(self, work, items: array) -> None:
+        if self.threads <= 1 or len(items) < 2:
+            work(items)
+            return
+        partitions = np.array_split(items, min(self.threads, len(items)))
+        with ThreadPoolExecutor(max_workers = len(partitions)) as pool:
+            for _ in pool.map(work, partitions):
+                pass
+        return
+
+    def is_materialized(self, row: int, col: int) -> bool:
+        block = int(self._tiles.index[row, col])
+        return block < 0 or bool(self._ready[block])
+
+    def _materialize(self, block: int) -> None:
+        row, col = self.rooms[block].tolist()
+        template_id = int(self.template_map[row, col])
+        room_view = self._tiles.blocks[block]
+        room_view[:] = self._templates[template_id]
+        Stage_3.populate_room(
+            room_view, self._counts[block], self._np_rng, self._bit_map, template_id
+        )
+        self._ready[block] = True
+        return
+
+    def _materialize_blocks(self, blocks: array[np.intp]) -> None:
+        rooms = self.rooms[blocks]
+        Stage_2.stamp_rooms(self.template_map, self.config, self._tiles, rooms)
+        Stage_3.keyed_room_populator(
+            self._tiles,
+            rooms,
+            self.theme_map[rooms[:, 0], rooms[:, 1]],
+            self.room_keys(rooms, POPULATE_STREAM),
+            self.config
+        )
+        self._ready[blocks] = True
+        return
+
+    def room(self, row: int, col: int) -> array[uint8]:
+        block = int(self._tiles.index[row, col])
+        if block < 0:
+            return self._empty_room
+        if self.room_streams:
+            if not self._ready[block]:
+                self._materialize_blocks(np.array([block]))
+        else:
+            while self._prefix <= block:
+                self._materialize(self._prefix)
+                self._prefix += 1
+        return self._tiles.blocks[block]
+
+    def __getitem__(self, key: tuple[int, int]) -> uint8:
+        y, x = key
+        rs = self.config.room_size
+        return self.room(y // rs, x // rs)[y % rs, x % rs]
+
+    def reroll_room(self, row: int, col: int) -> array[uint8]:
+        if not self.room_streams:
+            raise ValueError("reroll_room needs a LazyDungeon built with room_streams=True.")
+        if self.theme_map[row, col] == 0:
+            raise KeyError((row, col))
+        self._rerolls[row, col] += 1
+        self._plan(np.array([[row, col]]))
+        self._materialize_blocks(self._tiles.index[row:row + 1, col])
+        return self.room(row, col)
+
+    def materialize(self) -> tuple[array[uint8], array[uint8]]:
+        if self.room_streams:
+            self._run_partitions(self._materialize_blocks, np.flatnonzero(~self._ready))
+        else:
+            for row, col in self.rooms.tolist():
+                self.room(row, col)
+        return self._tiles.to_dense(), self.theme_map
+
+def reroll_room(dungeon: LazyDungeon, row: int, col: int) -> array[uint8]:
+    return dungeon.reroll_room(row, col)
@@ -0,0 +1,95 @@
+import numpy as np
+from numpy import uint8
+from numpy.typing import NDArray as array
+
+from Debug import timeit
+
+ORTHOGONAL = ((-1, 0), (1, 0), (0, -1), (0, 1))
+DIAGONAL = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+MAX_TARGETS = 8
+LOCAL_UPDATE_LIMIT = 1
+
+def _offsets(diagonal: bool) -> tuple[tuple[int, int], ...]:
+    return ORTHOGONAL + DIAGONAL if diagonal else ORTHOGONAL
+
+def _window(size: int, delta: int) -> tuple[slice, slice]:
+    if delta == 0:
+        return slice(None), slice(None)
+    return slice(1, size - 1), slice(1 + delta, size - 1 + delta)
+
+def _accumulate(
+        source: array,
+        out: array,
+        ufunc: np.ufunc,
+        diagonal: bool
+) -> array:
+    h, w = source.shape[-2:]
+    out.fill(0)
+    for dy, dx in _offsets(diagonal):
+        dst_rows, src_rows = _window(h, dy)
+        dst_cols, src_cols = _window(w, dx)
+        target = out[..., dst_rows, dst_cols]
+        ufunc(target, source[..., src_rows, src_cols], out = target)
+    return out
+
+@timeit
+def count_neighbors(
+        mask: array,
+        out: array[uint8],
+        diagonal: bool = False
+) -> array[uint8]:
+    return _accumulate(mask, out, np.add, diagonal)
+
+@timeit
+def count_targets(
+        tilemap: array[uint8],
+        targets: tuple[int, ...],
+        out: array[np.uint64] | None = None,
+        diagonal: bool = False
+) -> array[uint8]:
+    if len(targets) > MAX_TARGETS:
+        raise ValueError(
+            f"count_targets supports at most {MAX_TARGETS} targets, got {len(targets)}."
+        )
+    lanes = np.zeros(256, dtype = "<u8")
+    for lane, target in enumerate(targets):
+        lanes[target] |= np.uint64(1) << np.uint64(8 * lane)
+    if out is None:
+        out = np.empty(tilemap.shape, dtype = "<u8")
+    _accumulate(lanes[tilemap], out, np.add, diagonal)
+    counts = out.view(uint8).reshape(*tilemap.shape, MAX_TARGETS)
+    return counts[..., :len(targets)]
+
+@timeit
+def neighbor_bits(
+        tilemap: array[uint8],
+        out: array[np.uint32],
+        diagonal: bool = False
+) -> array[np.uint32]:
+    tile_bits = np.left_shift(1, tilemap, dtype = np.uint32)
+    return _accumulate(tile_bits, out, np.bitwise_or, diagonal)
+
+@timeit
+def update_neighbor_bits(
+        tilemap: array[uint8],
+        out: array[np.uint32],
+        coords: array[np.integer],
+        diagonal: bool = False
+) -> array[np.uint32]:
+    if len(coords) > LOCAL_UPDATE_LIMIT:
+        return neighbor_bits(tilemap, out, diagonal)
+    h, w = tilemap.shape
+    offsets = _offsets(diagonal)
+    for y, x in coords.tolist():
+        for ny, nx in ((y + dy, x + dx) for dy, dx in offsets):
+            if not (0 <= ny < h and 0 <= nx < w):
+                continue
+            bits = 0
+            for dy, dx in offsets:
+                if dy and not 0 < ny < h - 1:
+                    continue
+                if dx and not 0 < nx < w - 1:
+                    continue
+                bits |= 1 << int(tilemap[ny + dy, nx + dx])
+            out[ny, nx] = bits
+    return out
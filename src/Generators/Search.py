@@ -0,0 +1,149 @@
+import os
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from functools import partial
+from itertools import islice
+from random import Random
+from typing import NamedTuple
+
+import numpy as np
+from numpy import uint8
+from numpy.typing import NDArray as array
+
+import Stage_1, Stage_2, Stage_3
+from Gen_Helpers import DungeonConfig, DEFAULT_CONFIG, Theme, Tile
+
+LAYOUT_STAGE = 1
+PLAN_STAGE = 2
+TILE_STAGE = 3
+
+class SeedCandidate(NamedTuple):
+    seed: int
+    dungeon_map: array[uint8]
+    template_map: array[np.int16] | None = None
+    shape_map: array[np.int16] | None = None
+    theme_map: array[uint8] | None = None
+    tilemap: array[uint8] | None = None
+
+@dataclass(frozen = True)
+class SeedPredicate:
+    check: Callable[[SeedCandidate], bool]
+    stage: int = TILE_STAGE
+
+    def __post_init__(self) -> None:
+        if self.stage not in (LAYOUT_STAGE, PLAN_STAGE, TILE_STAGE):
+            raise ValueError(f"SeedPredicate stage must be 1, 2 or 3, got {self.stage}.")
+
+def _count_rooms(count: int, candidate: SeedCandidate) -> bool:
+    return int(np.count_nonzero(candidate.dungeon_map)) >= count
+
+def _count_theme(theme: Theme, count: int, candidate: SeedCandidate) -> bool:
+    return int(np.count_nonzero(candidate.theme_map == theme)) >= count
+
+def _count_tile(tile: Tile, count: int, candidate: SeedCandidate) -> bool:
+    return int(np.count_nonzero(candidate.tilemap == tile)) >= count
+
+def min_rooms(count: int) -> SeedPredicate:
+    return SeedPredicate(partial(_count_rooms, count), LAYOUT_STAGE)
+
+def has_theme(theme: Theme, count: int = 1) -> SeedPredicate:
+    return SeedPredicate(partial(_count_theme, theme, count), PLAN_STAGE)
+
+def has_tile(tile: Tile, count: int = 1) -> SeedPredicate:
+    return SeedPredicate(partial(_count_tile, tile, count), TILE_STAGE)
+
+def evaluate_seed(
+        seed: int,
+        predicates: Sequence[SeedPredicate],
+        vectorized: bool = False,
+        config: DungeonConfig = DEFAULT_CONFIG
+) -> bool:
+    np_rng = np.random.default_rng(seed)
+    rand_rng = Random(seed)
+    candidate = SeedCandidate(
+        seed, Stage_1.map_generator(np_rng, rand_rng, vectorized, config = config)
+    )
+    for predicate in sorted(predicates, key = lambda predicate: predicate.stage):
+        if predicate.stage >= PLAN_STAGE and candidate.theme_map is None:
+            template_map, theme_map = Stage_2.plan_rooms(
+                candidate.dungeon_map, np_rng, rand_rng
+            )
+            candidate = candidate._replace(
+                template_map = template_map,
+                shape_map = Stage_2.template_shapes(template_map),
+                theme_map = theme_map
+            )
+        if predicate.stage == TILE_STAGE and candidate.tilemap is None:
+            tilemap = Stage_2.stamp_rooms(candidate.template_map, config)
+            tilemap = Stage_3.room_populator(
+                tilemap, candidate.theme_map, np_rng, vectorized,
+                candidate.template_map, config = config
+            )
+            candidate = candidate._replace(tilemap = tilemap)
+        if not predicate.check(candidate):
+            return False
+    return True
+
+def _search_chunk(
+        seeds: list[int],
+        predicates: Sequence[SeedPredicate],
+        vectorized: bool,
+        config: DungeonConfig
+) -> list[int]:
+    return [
+        seed for seed in seeds if evaluate_seed(seed, predicates, vectorized, config)
+    ]
+
+def find_seeds(
+        predicate: SeedPredicate | Sequence[SeedPredicate],
+        seeds: Iterable[int],
+        workers: int | None = None,
+        chunksize: int = 256,
+        limit: int | None = None,
+        vectorized: bool = False,
+        config: DungeonConfig = DEFAULT_CONFIG
+) -> Iterator[int]:
+    predicates = (predicate,) if isinstance(predicate, SeedPredicate) else tuple(predicate)
+    workers = workers or os.cpu_count() or 1
+    seeds = iter(seeds)
+    found = 0
+    if workers == 1:
+        for seed in seeds:
+            if limit is not None and found >= limit:
+                return
+            if evaluate_seed(seed, predicates, vectorized, config):
+                found += 1
+                yield seed
+        return
+
+    search = partial(
+        _search_chunk, predicates = predicates, vectorized = vectorized, config = config
+    )
+    pool = ProcessPoolExecutor(max_workers = workers)
+    pending: set[Future[list[int]]] = set()
+
+    def submit_chunks(count: int) -> None:
+        for _ in range(count):
+            chunk = list(islice(seeds, chunksize))
+            if not chunk:
+                return
+            pending.add(pool.submit(search, chunk))
+        return
+
+    try:
+        submit_chunks(2 * workers)
+        while pending:
+            done, _ = wait(pending, return_when = FIRST_COMPLETED)
+            pending.difference_update(done)
+            submit_chunks(len(done))
+            for future in done:
+                for seed in future.result():
+                    if limit is not None and found >= limit:
+                        return
+                    found += 1
+                    yield seed
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait = True, cancel_futures = True)
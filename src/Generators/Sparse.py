@@ -0,0 +1,126 @@
+import numpy as np
+from numpy import uint8
+from numpy.typing import NDArray as array
+
+from Gen_Helpers import Const, Tile, room_major_view
+
+class _RoomGrid:
+    def __init__(self, tilemap: "BlockSparseTilemap") -> None:
+        self._tilemap = tilemap
+
+    def __getitem__(self, key: tuple[array[np.intp], array[np.intp]]) -> array[uint8]:
+        return self._tilemap.blocks[self._tilemap.block_index(*key)]
+
+    def __setitem__(
+            self,
+            key: tuple[array[np.intp], array[np.intp]],
+            value: array[uint8]
+    ) -> None:
+        self._tilemap.blocks[self._tilemap.block_index(*key)] = value
+        return
+
+class BlockSparseTilemap:
+    def __init__(
+            self,
+            room_mask: array[np.bool_],
+            room_size: int = Const.ROOM_SIZE
+    ) -> None:
+        rows, cols = np.nonzero(room_mask)
+        h, w = room_mask.shape
+        self.room_size = room_size
+        self.grid_shape = (h, w)
+        self.shape = (h * room_size, w * room_size)
+        self.dtype = np.dtype(uint8)
+        self.rooms = np.stack((rows, cols), axis = 1)
+        self.index = np.full((h, w), -1, dtype = np.int32)
+        self.index[rows, cols] = np.arange(rows.size, dtype = np.int32)
+        self.blocks = np.zeros((rows.size, room_size, room_size), dtype = uint8)
+
+    @classmethod
+    def from_dense(
+            cls,
+            tilemap: array[uint8],
+            room_mask: array[np.bool_] | None = None,
+            room_size: int = Const.ROOM_SIZE
+    ) -> "BlockSparseTilemap":
+        room_major = room_major_view(tilemap, room_size)
+        if room_mask is None:
+            room_mask = room_major.any(axis = (2, 3))
+        sparse = cls(room_mask, room_size)
+        sparse.blocks[:] = room_major[sparse.rooms[:, 0], sparse.rooms[:, 1]]
+        return sparse
+
+    @property
+    def nbytes(self) -> int:
+        return self.blocks.nbytes + self.index.nbytes + self.rooms.nbytes
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __array__(self, dtype: np.dtype | None = None, copy: bool | None = None) -> array:
+        dense = self.to_dense()
+        return dense if dtype is None else dense.astype(dtype, copy = False)
+
+    def block_index(self, rows: array[np.intp], cols: array[np.intp]) -> array[np.int32]:
+        blocks = self.index[rows, cols]
+        if np.any(blocks < 0):
+            raise KeyError("BlockSparseTilemap has no block for an inactive room.")
+        return blocks
+
+    def room(self, row: int, col: int) -> array[uint8]:
+        block = int(self.index[row, col])
+        if block < 0:
+            raise KeyError((row, col))
+        return self.blocks[block]
+
+    def room_major_view(self) -> _RoomGrid:
+        return _RoomGrid(self)
+
+    def _locate(
+            self,
+            key: tuple[int | array[np.integer], int | array[np.integer]]
+    ) -> tuple[array[np.int32], array[np.intp], array[np.intp]]:
+        if not isinstance(key, tuple) or len(key) != 2:
+            raise TypeError("BlockSparseTilemap only supports [y, x] indexing.")
+        coords = []
+        for axis, value in zip(self.shape, key):
+            value = np.asarray(value)
+            if value.dtype.kind not in "iu":
+                raise TypeError(
+                    "BlockSparseTilemap only supports integer [y, x] indexing, "
+                    "use to_dense() for slices."
+                )
+            if np.any((value < -axis) | (value >= axis)):
+                raise IndexError(f"Index out of bounds for axis of size {axis}.")
+            coords.append(np.where(value < 0, value + axis, value))
+        ys, xs = np.broadcast_arrays(*coords)
+        rs = self.room_size
+        return self.index[ys // rs, xs // rs], ys % rs, xs % rs
+
+    def __getitem__(
+            self,
+            key: tuple[int | array[np.integer], int | array[np.integer]]
+    ) -> uint8 | array[uint8]:
+        blocks, ys, xs = self._locate(key)
+        values = np.full(blocks.shape, Tile.WALL, dtype = uint8)
+        active = blocks >= 0
+        values[active] = self.blocks[blocks[active], ys[active], xs[active]]
+        return values[()]
+
+    def __setitem__(
+            self,
+            key: tuple[int | array[np.integer], int | array[np.integer]],
+            value: int | array[uint8]
+    ) -> None:
+        blocks, ys, xs = self._locate(key)
+        if np.any(blocks < 0):
+            raise KeyError("BlockSparseTilemap cannot write into an inactive room.")
+        self.blocks[blocks, ys, xs] = value
+        return
+
+    def to_dense(self, out: array[uint8] | None = None) -> array[uint8]:
+        if out is None:
+            out = np.empty(self.shape, dtype = uint8)
+        out.fill(Tile.WALL)
+        room_major_view(out, self.room_size)[self.rooms[:, 0], self.rooms[:, 1]] = self.blocks
+        return out
@@ -1,12 +1,21 @@
-from collections import deque
+from collections.abc import Sequence
 from random import Random
 
 import numpy as np
 from numpy import uint8
 from numpy.typing import NDArray as array
 
+from Connectivity import largest_component
 from Debug import timeit
-from Gen_Helpers import S1_Const
+from Neighbors import count_neighbors
+from Gen_Helpers import (
+    S1_Const,
+    DungeonConfig,
+    DEFAULT_CONFIG,
+    MASK_TO_INDICES,
+    CONNECTION_SUBSETS,
+    CONNECTION_SUBSET_COUNTS,
+)
 
 @timeit
 def _init_tilemap(height: int, width: int | None = None) -> array[uint8]:
@@ -17,17 +26,19 @@ def _init_tilemap(height: int, width: int | None = None) -> array[uint8]:
 @timeit
 def _room_fill(
         tilemap: array[uint8],
-        np_rng: np.random.Generator
+        np_rng: np.random.Generator,
+        config: DungeonConfig = DEFAULT_CONFIG
 ) -> array[uint8]:
-    for _ in range(S1_Const.BOX_COUNT):
-        y_start = np_rng.integers(1, S1_Const.MID)
-        y_end = np_rng.integers(S1_Const.MID + 2, S1_Const.DUNGEON_SIZE - 1)
+    size, mid = config.dungeon_size, config.mid
+    for _ in range(config.box_count):
+        y_start = np_rng.integers(1, mid)
+        y_end = np_rng.integers(mid + 2, size - 1)
 
         room_height = y_end-y_start
-        room_width = 16 - room_height
+        room_width = size - 4 - room_height
 
-        x_start = np_rng.integers(1, S1_Const.MID)
-        x_end = int(np.minimum(x_start + room_width + 5, S1_Const.DUNGEON_SIZE - 2))
+        x_start = np_rng.integers(1, mid)
+        x_end = int(np.minimum(x_start + room_width + 5, size - 2))
 
         tilemap[y_start:y_end, x_start:x_end] = S1_Const.TEMP
     return tilemap
@@ -37,22 +48,21 @@ def _fast_adj(
         tilemap: array[uint8],
         neighbor_map: array[uint8]
 ) -> None:
-    h, w = tilemap.shape
-    mask = (tilemap != 0).astype(uint8)
-    neighbor_map.fill(0)
-    neighbor_map[1:h-1, :] = mask[0:h-2, :] + mask[2:h, :]
-    neighbor_map[:, 1:w-1] += mask[:, 0:w-2] + mask[:, 2:w]
-    neighbor_map *= (tilemap == 1)
+    count_neighbors(tilemap, neighbor_map)
+    neighbor_map *= tilemap
     return
 
 @timeit
 def _room_eroder(
         tilemap: array[uint8],
-        np_rng: np.random.Generator
+        np_rng: np.random.Generator,
+        neighbor_map: array[uint8] | None = None,
+        config: DungeonConfig = DEFAULT_CONFIG
 ) -> array[uint8]:
-    neighbor_map = np.empty_like(tilemap, dtype=uint8)
+    if neighbor_map is None:
+        neighbor_map = np.empty_like(tilemap, dtype=uint8)
 
-    for _ in range(S1_Const.ERODE_COUNT):
+    for _ in range(config.erode_count):
         _fast_adj(tilemap, neighbor_map)
 
         mask_2 = (neighbor_map == 2)
@@ -69,6 +79,62 @@ def _room_eroder(
     tilemap[neighbor_map == 0] = S1_Const.NO_ROOM
     return tilemap
 
+@timeit
+def _room_fill_batch(
+        tilemaps: array[uint8],
+        np_rngs: Sequence[np.random.Generator],
+        config: DungeonConfig = DEFAULT_CONFIG
+) -> array[uint8]:
+    size, mid = config.dungeon_size, config.mid
+    bounds = np.empty((len(np_rngs), config.box_count, 4), dtype = np.intp)
+    for i, np_rng in enumerate(np_rngs):
+        for box in range(config.box_count):
+            y_start = np_rng.integers(1, mid)
+            y_end = np_rng.integers(mid + 2, size - 1)
+            x_start = np_rng.integers(1, mid)
+            bounds[i, box] = y_start, y_end, x_start, 0
+
+    room_width = size - 4 - (bounds[..., 1] - bounds[..., 0])
+    bounds[..., 3] = np.minimum(bounds[..., 2] + room_width + 5, size - 2)
+    cells = np.arange(size)
+    in_rows = (
+        (cells >= bounds[..., 0, np.newaxis]) & (cells < bounds[..., 1, np.newaxis])
+    )
+    in_cols = (
+        (cells >= bounds[..., 2, np.newaxis]) & (cells < bounds[..., 3, np.newaxis])
+    )
+    boxes = (in_rows[..., :, np.newaxis] & in_cols[..., np.newaxis, :]).any(axis = 1)
+    tilemaps[boxes] = S1_Const.TEMP
+    return tilemaps
+
+@timeit
+def _room_eroder_batch(
+        tilemaps: array[uint8],
+        np_rngs: Sequence[np.random.Generator],
+        config: DungeonConfig = DEFAULT_CONFIG
+) -> array[uint8]:
+    neighbor_map = np.empty_like(tilemaps, dtype=uint8)
+    shape = tilemaps.shape[-2:]
+
+    for _ in range(config.erode_count):
+        _fast_adj(tilemaps, neighbor_map)
+
+        mask_2 = (neighbor_map == 2)
+        randoms = np.stack([
+            np_rng.random(shape, dtype = np.float32) for np_rng in np_rngs
+        ])
+        tilemaps[mask_2 & (randoms < 0.5)] = S1_Const.NO_ROOM
+
+        mask_3 = (neighbor_map == 3)
+        randoms = np.stack([
+            np_rng.random(shape, dtype = np.float32) for np_rng in np_rngs
+        ])
+        tilemaps[mask_3 & (randoms < 0.1)] = S1_Const.NO_ROOM
+
+    _fast_adj(tilemaps, neighbor_map)
+    tilemaps[neighbor_map == 0] = S1_Const.NO_ROOM
+    return tilemaps
+
 @timeit
 def _get_possible_connections(tilemap: array[uint8]) -> array[uint8]:
     t = (tilemap != 0).astype(uint8)
@@ -100,10 +166,6 @@ def _room_connector(
     H, W = tilemap.shape
     active_count = int(np.count_nonzero(tilemap != 0))
     connection_counts = _room_random(np_rng, active_count)
-    MASK_TO_INDICES = tuple(
-        tuple(i for i in range(4) if mask & (1 << i))
-        for mask in range(16)
-    )
     DIR_BITS = (1,2,4,8)
     DY_DX = ((-1,0),(0,1),(1,0),(0,-1))
     OPP_BITS = (4,8,1,2)
@@ -144,6 +206,31 @@ def _room_connector(
                 tilemap[ny, nx] |= OPP_BITS[i]
     return tilemap
 
+@timeit
+def _room_connector_vectorized(
+        tilemap: array[uint8],
+        np_rng: np.random.Generator
+) -> array[uint8]:
+    connection_map = _get_possible_connections(tilemap) & 0b1111
+    active_count = int(np.count_nonzero(tilemap != 0))
+    connection_counts = _room_random(np_rng, active_count)
+
+    connectable = connection_map != 0
+    masks = connection_map[connectable]
+    counts = connection_counts[:masks.size]
+    picks = (
+        np_rng.random(masks.size) * CONNECTION_SUBSET_COUNTS[masks, counts]
+    ).astype(np.intp)
+    chosen = np.zeros_like(connection_map)
+    chosen[connectable] = CONNECTION_SUBSETS[masks, counts, picks]
+
+    tilemap[1:-1, 1:-1] |= chosen
+    tilemap[:-2, 1:-1] |= (chosen & 0b0001) << 2
+    tilemap[1:-1, 2:] |= (chosen & 0b0010) << 2
+    tilemap[2:, 1:-1] |= (chosen & 0b0100) >> 2
+    tilemap[1:-1, :-2] |= (chosen & 0b1000) >> 2
+    return tilemap
+
 @timeit
 def _tilemap_trim(tilemap: array[uint8]) -> array[uint8]:
     active_rows = np.any(tilemap != 0, axis=1)
@@ -151,52 +238,62 @@ def _tilemap_trim(tilemap: array[uint8]) -> array[uint8]:
     trimmed_tilemap = tilemap[np.ix_(active_rows, active_cols)]
     return trimmed_tilemap
 
+@timeit
+def _tilemap_trim_batch(tilemaps: array[uint8]) -> list[array[uint8]]:
+    active_rows = np.any(tilemaps != 0, axis=2)
+    active_cols = np.any(tilemaps != 0, axis=1)
+    return [
+        tilemap[np.ix_(rows, cols)]
+        for tilemap, rows, cols in zip(tilemaps, active_rows, active_cols)
+    ]
+
 @timeit
 def _room_clear(tilemap: array[uint8]) -> array[uint8]:
-    DIR_OFFSETS = ((0,-1,0),(1,0,1),(2,1,0),(3,0,-1))
-    h, w = tilemap.shape
-    active_tiles = {(r, c) for r, c in np.argwhere(tilemap != 0).tolist()}
-    groups: list[set[tuple[int, int]]] = []
-    unvisited = active_tiles.copy()
-    while unvisited:
-        start = next(iter(unvisited))
-        group: set[tuple[int, int]] = set()
-        visited: set[tuple[int, int]] = {start}
-        queue = deque([start])
-        while queue:
-            y, x = queue.popleft()
-            group.add((y, x))
-            val = tilemap[y, x]
-            for bit, dy, dx in DIR_OFFSETS:
-                if val & (1 << bit):
-                    ny, nx = y + dy, x + dx
-                    in_bounds: bool = 0 <= ny < h and 0 <= nx < w
-                    if in_bounds and (ny, nx) not in visited:
-                        visited.add((ny, nx))
-                        queue.append((ny, nx))
-        groups.append(group)
-        unvisited -= group
-    
-    if groups:
-        largest = max(groups, key=len)
-        remainder = active_tiles - largest
-        if remainder:
-            to_remove = np.array(
-                list(remainder), dtype=np.int32
-            ).reshape(-1, 2)
-            tilemap[to_remove[:, 0], to_remove[:, 1]] = 0
+    tilemap[~largest_component(tilemap)] = S1_Const.NO_ROOM
     return tilemap
 
 @timeit
 def map_generator(
         np_rng: np.random.Generator,
-        rand_rng: Random
+        rand_rng: Random,
+        vectorized: bool = False,
+        tilemap: array[uint8] | None = None,
+        neighbor_map: array[uint8] | None = None,
+        config: DungeonConfig = DEFAULT_CONFIG
 ) -> array[uint8]:
-    tilemap = _init_tilemap(S1_Const.DUNGEON_SIZE)
-    tilemap = _room_fill(tilemap, np_rng)
-    tilemap = _room_eroder(tilemap, np_rng)
+    if tilemap is None:
+        tilemap = _init_tilemap(config.dungeon_size)
+    else:
+        tilemap.fill(0)
+    tilemap = _room_fill(tilemap, np_rng, config)
+    tilemap = _room_eroder(tilemap, np_rng, neighbor_map, config)
     tilemap <<= 4
-    tilemap = _room_connector(tilemap, np_rng, rand_rng)
+    if vectorized:
+        tilemap = _room_connector_vectorized(tilemap, np_rng)
+    else:
+        tilemap = _room_connector(tilemap, np_rng, rand_rng)
     tilemap = _room_clear(tilemap)
     tilemap = _tilemap_trim(tilemap)
-    return tilemap
\ No newline at end of file
+    return tilemap
+
+@timeit
+def map_generator_batch(
+        np_rngs: Sequence[np.random.Generator],
+        rand_rngs: Sequence[Random],
+        vectorized: bool = False,
+        config: DungeonConfig = DEFAULT_CONFIG
+) -> list[array[uint8]]:
+    if not np_rngs:
+        return []
+    size = config.dungeon_size
+    tilemaps = np.zeros((len(np_rngs), size, size), dtype = uint8)
+    tilemaps = _room_fill_batch(tilemaps, np_rngs, config)
+    tilemaps = _room_eroder_batch(tilemaps, np_rngs, config)
+    tilemaps <<= 4
+    for tilemap, np_rng, rand_rng in zip(tilemaps, np_rngs, rand_rngs):
+        if vectorized:
+            _room_connector_vectorized(tilemap, np_rng)
+        else:
+            _room_connector(tilemap, np_rng, rand_rng)
+    tilemaps = _room_clear(tilemaps)
+    return _tilemap_trim_batch(tilemaps)
@@ -1,3 +1,4 @@
+from functools import cache
 from random import Random
 
 import numpy as np
@@ -10,16 +11,26 @@ from Gen_Helpers import (
     Shape,
     Theme,
     InvalidRoom,
-    SHAPE_TABLES, 
-    THEME_TABLES, 
-    SMALL_CIRCLE_MASK, 
-    LARGE_CIRCLE_MASK,
+    SHAPE_CHOICES,
+    SHAPE_CUM_WEIGHTS,
+    THEME_CHOICES,
+    THEME_CUM_WEIGHTS,
+    EXIT_COUNTS,
     ONE_EXIT_ROOMS,
+    ROOM_CHUNK,
+    S1_Const,
+    DungeonConfig,
+    DEFAULT_CONFIG,
+    circle_masks,
+    room_major_view,
     )
 from Debug import timeit
+from Sparse import BlockSparseTilemap
 
 @timeit
-def _get_entrance_room(dungeon_map: array[uint8], rand_rng: Random):
+def get_entrance_room(dungeon_map: array[uint8], rand_rng: Random):
+    if not dungeon_map.any():
+        raise InvalidRoom("The get_entrance_room function got a dungeon_map with no rooms.")
     mask = np.isin(dungeon_map, ONE_EXIT_ROOMS)
     coords = np.argwhere(mask)
     if coords.size == 0:
@@ -28,46 +39,67 @@ def _get_entrance_room(dungeon_map: array[uint8], rand_rng: Random):
     return int(r), int(c)
 
 @timeit
-def _init_maps(multiplier: int, h: int,w: int) -> tuple[array[uint8], array[uint8]]:
-    tilemap = np.zeros((h * multiplier, w * multiplier), dtype = uint8)
+def _init_maps(
+        multiplier: int,
+        h: int,
+        w: int,
+        room_major: bool = False
+) -> tuple[array[uint8], array[uint8]]:
+    if room_major:
+        tilemap = np.zeros((h, w, multiplier, multiplier), dtype = uint8)
+    else:
+        tilemap = np.zeros((h * multiplier, w * multiplier), dtype = uint8)
     theme_map = np.zeros((h, w), dtype = uint8)
     return tilemap, theme_map
 
+def _weighted_pick(
+        choices: array[uint8],
+        cum_weights: array[np.float64],
+        keys: array[uint8],
+        draws: array[np.float64]
+) -> array[uint8]:
+    rows = cum_weights[keys]
+    option_counts = np.count_nonzero(np.isfinite(rows), axis = 1)
+    totals = rows[np.arange(keys.size), option_counts - 1]
+    picks = np.count_nonzero(rows <= (draws * totals)[:, np.newaxis], axis = 1)
+    picks = np.minimum(picks, option_counts - 1)
+    return choices[keys, picks]
+
 @timeit
-def _get_shape(room_val: uint8, rand_rng: Random) -> Shape:
-    if room_val < 0b10000 or room_val > 0b11111:
+def _get_shapes(room_vals: array[uint8], draws: array[np.float64]) -> array[uint8]:
+    invalid = (room_vals < 0b10000) | (room_vals > 0b11111)
+    if invalid.any():
         raise InvalidRoom(
-            f"The get_shape function does not support room_val: {room_val}."
+            f"The get_shapes function does not support room_val: {room_vals[invalid][0]}."
         )
-    n = (room_val & 0b01111).bit_count()
-    if n not in SHAPE_TABLES:
+    exit_counts = EXIT_COUNTS[room_vals & 0b01111]
+    unsupported = ~np.isfinite(SHAPE_CUM_WEIGHTS[exit_counts, 0])
+    if unsupported.any():
         raise InvalidRoom(
-            f"The get_shape function does not support rooms with {n} exits."
+            f"The get_shapes function does not support rooms with {exit_counts[unsupported][0]} exits."
         )
-    shape_list, probs = SHAPE_TABLES[n]
-    room_shape: Shape = rand_rng.choices(shape_list, probs)[0]
-    return room_shape
+    return _weighted_pick(SHAPE_CHOICES, SHAPE_CUM_WEIGHTS, exit_counts, draws)
 
 @timeit
 def _build_room(
         tilemap: array[uint8],
         room_val: uint8,
         room_shape: Shape,
-        np_rng: np.random.Generator
+        length: int = Const.DEAD_END_MIN
 ) -> array[uint8]:
-    half = Const.HALF
+    room_size = tilemap.shape[0]
+    half = room_size // 2
     if 0b00001 & room_val:
         tilemap[0:half+1, half-1:half+2] = Tile.FLOOR
     if 0b00010 & room_val:
-        tilemap[half-1:half+2, half:Const.ROOM_SIZE] = Tile.FLOOR
+        tilemap[half-1:half+2, half:room_size] = Tile.FLOOR
     if 0b00100 & room_val:
-        tilemap[half:Const.ROOM_SIZE, half-1:half+2] = Tile.FLOOR
+        tilemap[half:room_size, half-1:half+2] = Tile.FLOOR
     if 0b01000 & room_val:
         tilemap[half-1:half+2, 0:half+1] = Tile.FLOOR
     
     match room_shape:
         case Shape.DEAD_END:
-            length = np_rng.integers(2,5, endpoint = True)
             s = slice(half-length, half+length+1)
             tilemap[s,s] = Tile.WALL
         case Shape.BOSS_ROOM:
@@ -103,46 +135,195 @@ def _build_room(
                 case _:
                     pass
         case Shape.SMALL_CIRCLE:
-            tilemap[SMALL_CIRCLE_MASK] = Tile.FLOOR
+            tilemap[circle_masks(room_size)[0]] = Tile.FLOOR
         case Shape.LARGE_CIRCLE:
-            tilemap[LARGE_CIRCLE_MASK] = Tile.FLOOR
+            tilemap[circle_masks(room_size)[1]] = Tile.FLOOR
     return tilemap
 
 @timeit
-def _get_theme(room_shape: Shape, rand_rng: Random) -> Theme:
-    if room_shape not in THEME_TABLES:
+def _get_themes(room_shapes: array[uint8], draws: array[np.float64]) -> array[uint8]:
+    unsupported = ~np.isfinite(THEME_CUM_WEIGHTS[room_shapes, 0])
+    if unsupported.any():
         raise InvalidRoom(
-            f"get_theme does not support rooms with {room_shape.name} shape"
+            f"get_themes does not support rooms with {Shape(room_shapes[unsupported][0]).name} shape"
         )
-    theme_list, probs = THEME_TABLES[room_shape]
-    theme: Theme = rand_rng.choices(theme_list, probs)[0]
-    return theme
+    return _weighted_pick(THEME_CHOICES, THEME_CUM_WEIGHTS, room_shapes, draws)
+
+TEMPLATE_SLOTS = len(Shape) + Const.DEAD_END_MAX - Const.DEAD_END_MIN
+
+def _template_ids(
+        room_vals: array[uint8],
+        shapes: array[uint8],
+        lengths: array[np.intp]
+) -> array[np.int16]:
+    slots = np.where(
+        shapes == Shape.DEAD_END,
+        lengths - Const.DEAD_END_MIN,
+        shapes.astype(np.intp) + Const.DEAD_END_MAX - Const.DEAD_END_MIN
+    )
+    return ((room_vals & 0b01111) * TEMPLATE_SLOTS + slots).astype(np.int16)
+
+@cache
+def room_templates(room_size: int) -> array[uint8]:
+    templates = np.zeros(
+        shape = (16 * TEMPLATE_SLOTS, room_size, room_size),
+        dtype = uint8
+    )
+    dead_end_lengths = range(Const.DEAD_END_MIN, Const.DEAD_END_MAX + 1)
+    for mask in range(16):
+        room_val = uint8(mask | S1_Const.ROOM)
+        for shape in Shape:
+            lengths = dead_end_lengths if shape == Shape.DEAD_END else (0,)
+            for length in lengths:
+                template_id = _template_ids(
+                    np.array([room_val]), np.array([shape]), np.array([length])
+                )[0]
+                _build_room(templates[template_id], room_val, shape, length)
+    templates.flags.writeable = False
+    return templates
 
 @timeit
-def tilemap_builder(
+def _plan_rooms(
         dungeon_map: array[uint8],
+        theme_map: array[uint8],
+        template_map: array[np.int16],
         np_rng: np.random.Generator,
         rand_rng: Random
-) -> tuple[array[uint8],array[uint8]]:
-    multiplier = Const.ROOM_SIZE
-    tilemap, theme_map = _init_maps(multiplier, *dungeon_map.shape)
-    entrance = _get_entrance_room(dungeon_map, rand_rng)
-    room_tilemap = np.empty(
-        shape = (Const.ROOM_SIZE, Const.ROOM_SIZE),
-        dtype = uint8
+) -> tuple[array[np.int16], array[uint8]]:
+    template_map.fill(-1)
+    entrance = get_entrance_room(dungeon_map, rand_rng)
+    rows, cols = np.nonzero(dungeon_map)
+    room_vals = dungeon_map[rows, cols]
+    themed = (rows != entrance[0]) | (cols != entrance[1])
+    random = rand_rng.random
+    draws = np.array([random() for _ in range(2 * int(np.count_nonzero(themed)))])
+    draws = draws.reshape(-1, 2)
+
+    shapes = np.full(rows.size, Shape.DEAD_END, dtype = uint8)
+    themes = np.full(rows.size, Theme.ENTRANCE, dtype = uint8)
+    shapes[themed] = _get_shapes(room_vals[themed], draws[:, 0])
+    themes[themed] = _get_themes(shapes[themed], draws[:, 1])
+    theme_map[rows, cols] = themes
+
+    dead_ends = shapes == Shape.DEAD_END
+    lengths = np.zeros(rows.size, dtype = np.intp)
+    lengths[dead_ends] = np_rng.integers(
+        Const.DEAD_END_MIN, Const.DEAD_END_MAX,
+        endpoint = True, size = int(np.count_nonzero(dead_ends))
     )
-    for row, col in np.argwhere(dungeon_map != 0):
-        room_tilemap.fill(0)
-        val = uint8(dungeon_map[row, col])
-        if (row, col) == entrance:
-            theme = Theme.ENTRANCE
-            shape = Shape.DEAD_END
+    template_map[rows, cols] = _template_ids(room_vals, shapes, lengths)
+    return template_map, theme_map
+
+@timeit
+def plan_cells(
+        room_vals: array[uint8],
+        draws: array[np.float64],
+        entrance: array[np.bool_]
+) -> tuple[array[np.int16], array[uint8]]:
+    themed = ~entrance
+    shapes = np.full(room_vals.size, Shape.DEAD_END, dtype = uint8)
+    themes = np.full(room_vals.size, Theme.ENTRANCE, dtype = uint8)
+    shapes[themed] = _get_shapes(room_vals[themed], draws[themed, 0])
+    themes[themed] = _get_themes(shapes[themed], draws[themed, 1])
+
+    span = Const.DEAD_END_MAX - Const.DEAD_END_MIN + 1
+    lengths = np.where(
+        shapes == Shape.DEAD_END,
+        Const.DEAD_END_MIN + (draws[:, 2] * span).astype(np.intp),
+        0
+    )
+    return _template_ids(room_vals, shapes, lengths), themes
+
+@timeit
+def plan_rooms(
+        dungeon_map: array[uint8],
+        np_rng: np.random.Generator,
+        rand_rng: Random,
+        template_map: array[np.int16] | None = None,
+        theme_map: array[uint8] | None = None
+) -> tuple[array[np.int16], array[uint8]]:
+    if template_map is None:
+        template_map = np.empty(dungeon_map.shape, dtype = np.int16)
+    if theme_map is None:
+        theme_map = np.zeros(dungeon_map.shape, dtype = uint8)
+    else:
+        theme_map.fill(0)
+    return _plan_rooms(dungeon_map, theme_map, template_map, np_rng, rand_rng)
+
+@timeit
+def _stamp_rooms(
+        tilemap: array[uint8],
+        template_map: array[np.int16],
+        room_size: int = Const.ROOM_SIZE,
+        rooms: array[np.intp] | None = None
+) -> array[uint8] | BlockSparseTilemap:
+    if rooms is None:
+        rows, cols = np.nonzero(template_map >= 0)
+    else:
+        rows, cols = rooms[:, 0], rooms[:, 1]
+    if isinstance(tilemap, BlockSparseTilemap):
+        room_major = tilemap.room_major_view()
+    else:
+        room_major = room_major_view(tilemap, room_size)
+    templates = room_templates(room_size)
+    for start in range(0, rows.size, ROOM_CHUNK):
+        chunk_rows = rows[start:start + ROOM_CHUNK]
+        chunk_cols = cols[start:start + ROOM_CHUNK]
+        room_major[chunk_rows, chunk_cols] = templates[
+            template_map[chunk_rows, chunk_cols]
+        ]
+    return tilemap
+
+@timeit
+def stamp_rooms(
+        template_map: array[np.int16],
+        config: DungeonConfig = DEFAULT_CONFIG,
+        tilemap: array[uint8] | BlockSparseTilemap | None = None,
+        rooms: array[np.intp] | None = None
+) -> array[uint8] | BlockSparseTilemap:
+    if tilemap is None:
+        tilemap, _ = _init_maps(config.room_size, *template_map.shape)
+    return _stamp_rooms(tilemap, template_map, config.room_size, rooms)
+
+def template_shapes(template_map: array[np.int16]) -> array[np.int16]:
+    slots = template_map % TEMPLATE_SLOTS
+    dead_end_slots = Const.DEAD_END_MAX - Const.DEAD_END_MIN
+    shapes = np.where(slots <= dead_end_slots, Shape.DEAD_END, slots - dead_end_slots)
+    return np.where(template_map >= 0, shapes, -1).astype(np.int16)
+
+@timeit
+def tilemap_builder(
+        dungeon_map: array[uint8],
+        np_rng: np.random.Generator,
+        rand_rng: Random,
+        template_map: array[np.int16] | None = None,
+        tilemap: array[uint8] | None = None,
+        theme_map: array[uint8] | None = None,
+        config: DungeonConfig = DEFAULT_CONFIG,
+        sparse: bool = False,
+        room_major: bool = False
+) -> tuple[array[uint8] | BlockSparseTilemap, array[uint8]]:
+    if sparse and room_major:
+        raise ValueError("tilemap_builder cannot be both sparse and room_major.")
+    if sparse:
+        if tilemap is not None:
+            raise ValueError("tilemap_builder cannot fill a dense tilemap in sparse mode.")
+        tilemap = BlockSparseTilemap(dungeon_map != 0, config.room_size)
+        if theme_map is None:
+            theme_map = np.zeros(dungeon_map.shape, dtype = uint8)
         else:
-            shape = _get_shape(val, rand_rng)
-            theme = _get_theme(shape, rand_rng)
-        room_tilemap = _build_room(room_tilemap, val, shape, np_rng)
-        y = row * multiplier
-        x = col * multiplier
-        tilemap[y:y + multiplier, x:x + multiplier] = room_tilemap
-        theme_map[row, col] = theme
-    return tilemap, theme_map
\ No newline at end of file
+            theme_map.fill(0)
+    elif tilemap is None or theme_map is None:
+        tilemap, theme_map = _init_maps(
+            config.room_size, *dungeon_map.shape, room_major
+        )
+    else:
+        tilemap.fill(0)
+        theme_map.fill(0)
+    if template_map is None:
+        template_map = np.empty(dungeon_map.shape, dtype = np.int16)
+    template_map, theme_map = _plan_rooms(
+        dungeon_map, theme_map, template_map, np_rng, rand_rng
+    )
+    tilemap = _stamp_rooms(tilemap, template_map, config.room_size)
+    return tilemap, theme_map
@@ -1,92 +1,134 @@
-from collections.abc import Collection
-
 import numpy as np
 from numpy import uint8
 from numpy.typing import NDArray as array
 
 from Debug import timeit
+from Neighbors import neighbor_bits, update_neighbor_bits
+from Sparse import BlockSparseTilemap
 from Gen_Helpers import (
     Tile,
     Const,
-    Theme,
-    POPULATION_TABLES,
+    POPULATION_MIN,
+    POPULATION_MAX,
+    POPULATION_RANGED,
     FEATURE_ORDER,
-    SCAN_PARAMS,
+    SCAN_MASKS,
     DUPLICATES,
+    ROOM_CHUNK,
+    DungeonConfig,
+    DEFAULT_CONFIG,
+    room_major_view,
+    mix_keys,
+    key_uniforms,
 )
 
+def _ranged_counts(
+        themes: array[uint8]
+) -> tuple[array[np.int32], array[np.intp], array[np.intp], array[np.int32], array[np.int32]]:
+    counts = POPULATION_MIN[themes]
+    ranged = POPULATION_RANGED[themes]
+    room_index, slot = np.nonzero(ranged >= 0)
+    feature_index = ranged[room_index, slot]
+    ranged_themes = themes[room_index]
+    return (
+        counts,
+        room_index,
+        feature_index,
+        POPULATION_MIN[ranged_themes, feature_index],
+        POPULATION_MAX[ranged_themes, feature_index]
+    )
+
 @timeit
-def _resolve_counts(
+def resolve_counts(
         theme_map: array[uint8],
         np_rng: np.random.Generator
-) -> dict[tuple[int,int],dict[Tile,int]]:
-    counts: dict[tuple[int, int], dict[Tile, int]] = {}
-    for row, col in np.argwhere(theme_map != 0):
-        theme = Theme(int(theme_map[row, col]))
-        resolved: dict[Tile, int] = {}
-        for feature, count in POPULATION_TABLES[theme].items():
-            if isinstance(count, tuple):
-                resolved[feature] = int(np_rng.integers(
-                    count[0], count[1], endpoint=True
-                ))
-            else:
-                resolved[feature] = count
-        counts[int(row), int(col)] = resolved
+) -> tuple[array[np.intp], array[np.int32]]:
+    rooms = np.argwhere(theme_map != 0)
+    themes = theme_map[rooms[:, 0], rooms[:, 1]]
+    counts, room_index, feature_index, low, high = _ranged_counts(themes)
+    counts[room_index, feature_index] = np_rng.integers(low, high, endpoint = True)
+    return rooms, counts
+
+@timeit
+def resolve_keyed_counts(
+        themes: array[uint8],
+        room_keys: array[np.uint64]
+) -> array[np.int32]:
+    counts, room_index, feature_index, low, high = _ranged_counts(themes)
+    draws = key_uniforms(mix_keys(room_keys[room_index], 0, feature_index))
+    counts[room_index, feature_index] = low + (draws * (high - low + 1)).astype(np.int32)
     return counts
 
+_STATIC_TILES = (1 << Tile.WALL) | (1 << Tile.FLOOR)
+_CANDIDATES: dict[
+    tuple[int, int], dict[Tile, tuple[array[np.int32], array[np.int32]]]
+] = {}
+
 @timeit
-def _adj_map(
-            tilemap: array[uint8],
-            neighbor_map:array[uint8],
-            iso:bool=True,
-            target:Collection[int] | None = None
-) -> array[uint8]:
-    h, w = tilemap.shape
-    if target is not None:
-        if len(target) == 1:
-            mask = (tilemap == next(iter(target))).astype(uint8)
-        else:
-            mask = np.isin(tilemap, tuple(target)).astype(uint8)
+def _initial_candidates(
+        tilemap: array[uint8],
+        neighbor_bits: array[np.uint32],
+        place_on: int,
+        require: int = 0,
+        **_: int
+) -> array[np.int32]:
+    if place_on & ~_STATIC_TILES:
+        available_grid = np.ones_like(tilemap, dtype = np.bool_)
     else:
-        mask = (tilemap != 0).astype(uint8)
-    neighbor_map.fill(0)
+        available_grid = (np.left_shift(1, tilemap, dtype = np.uint32) & place_on) != 0
+        if require and not require & ~_STATIC_TILES:
+            available_grid &= (neighbor_bits & require) != 0
+    return np.ascontiguousarray(np.nonzero(available_grid), dtype = np.int32)
 
-    neighbor_map[1:h-1, :] = mask[0:h-2, :] + mask[2:h, :]
-    neighbor_map[:, 1:w-1] += mask[:, 0:w-2] + mask[:, 2:w]
-    if iso: neighbor_map *= (tilemap == 1)
-    assert neighbor_map is not None
-    return neighbor_map
+def _template_candidates(
+        tilemap: array[uint8],
+        neighbor_bits: array[np.uint32],
+        template_id: int
+) -> dict[Tile, tuple[array[np.int32], array[np.int32]]]:
+    key = (tilemap.shape[0], template_id)
+    candidates = _CANDIDATES.get(key)
+    if candidates is None:
+        candidates = {
+            feature: (
+                _scan_tilemap(tilemap, neighbor_bits, **masks),
+                _initial_candidates(tilemap, neighbor_bits, **masks)
+            )
+            for feature, masks in SCAN_MASKS.items()
+        }
+        _CANDIDATES[key] = candidates
+    return candidates
 
 @timeit
 def _scan_tilemap(
         tilemap: array[uint8],
-        neighbor_map: array[uint8] | None = None,
-        require: Collection[int] | None = None,
-        block: Collection[int] | None = None,
-        bias: Collection[int] | None = None,
-        place_on: Collection[int] | None = None
+        neighbor_bits: array[np.uint32],
+        place_on: int,
+        require: int = 0,
+        block: int = 0,
+        bias: int = 0,
+        candidates: array[np.int32] | None = None
 ) -> array[np.int32]:
-    if place_on is None: available_grid = tilemap == Tile.FLOOR
-    else: available_grid = np.isin(tilemap,tuple(place_on))
-
-    if neighbor_map is None:
-        neighbor_map = np.empty_like(tilemap, dtype=uint8)
-
-    if require is not None:
-        available_grid &= (
-            _adj_map(tilemap, neighbor_map, target = require, iso = False) != 0
-        )
-    if block is not None:
-        available_grid &= (
-            _adj_map(tilemap, neighbor_map, target = block, iso = False) == 0
-        )
+    if candidates is None:
+        available_grid = (np.left_shift(1, tilemap, dtype = np.uint32) & place_on) != 0
+        if require:
+            available_grid &= (neighbor_bits & require) != 0
+        if block:
+            available_grid &= (neighbor_bits & block) == 0
+        available_list = np.argwhere(available_grid).astype(np.int32, copy=False)
+    else:
+        ys, xs = candidates
+        cell_bits = neighbor_bits[ys, xs]
+        keep = (np.left_shift(1, tilemap[ys, xs], dtype = np.uint32) & place_on) != 0
+        if require:
+            keep &= (cell_bits & require) != 0
+        if block:
+            keep &= (cell_bits & block) == 0
+        available_list = candidates[:, keep].T
 
-    available_list = np.argwhere(available_grid).astype(np.int32, copy=False)
-    if bias is not None:
-        bias_grid = (
-            _adj_map(tilemap, neighbor_map, target=bias, iso=False) != 0
-        )
-        bias_mask = bias_grid[available_list[:, 0], available_list[:, 1]]
+    if bias:
+        bias_mask = (
+            neighbor_bits[available_list[:, 0], available_list[:, 1]] & bias
+        ) != 0
         biases = available_list[bias_mask]
         if biases.size > 0:
             bias_list = np.repeat(biases, 4, axis=0)
@@ -101,9 +143,8 @@ def _place(
         feature: Tile,
         available_list: array[np.int32],
         count: int,
-        np_rng: np.random.Generator) -> None:
+        np_rng: np.random.Generator) -> array[np.int32]:
     count = min(count, len(available_list))
-    if not count: return
     indices = np_rng.choice(len(available_list), size=count, replace=False)
     coords = available_list[indices]
     if feature in DUPLICATES:
@@ -111,33 +152,209 @@ def _place(
     else:
         tile = feature
     tilemap[coords[:, 0], coords[:, 1]] = tile
+    return coords
+
+@timeit
+def _scan_rooms(
+        blocks: array[uint8],
+        neighbor_bits: array[np.uint32],
+        place_on: int,
+        require: int = 0,
+        block: int = 0,
+        bias: int = 0
+) -> array[np.intp]:
+    available_grid = (np.left_shift(1, blocks, dtype = np.uint32) & place_on) != 0
+    if require:
+        available_grid &= (neighbor_bits & require) != 0
+    if block:
+        available_grid &= (neighbor_bits & block) == 0
+
+    available_list = np.argwhere(available_grid)
+    if bias:
+        bias_mask = (
+            neighbor_bits[
+                available_list[:, 0], available_list[:, 1], available_list[:, 2]
+            ] & bias
+        ) != 0
+        biases = available_list[bias_mask]
+        if biases.size > 0:
+            bias_list = np.repeat(biases, 4, axis=0)
+            available_list = np.concatenate(
+                (available_list,bias_list),axis = 0
+            )
+    return available_list
+
+def _room_ordinals(rooms: array[np.intp]) -> array[np.intp]:
+    order = np.argsort(rooms, kind = "stable")
+    ordered_rooms = rooms[order]
+    positions = np.arange(order.size)
+    group_start = np.r_[True, ordered_rooms[1:] != ordered_rooms[:-1]]
+    ordinals = np.empty_like(positions)
+    ordinals[order] = positions - np.maximum.accumulate(np.where(group_start, positions, 0))
+    return ordinals
+
+@timeit
+def _place_rooms(
+        blocks: array[uint8],
+        feature: Tile,
+        available_list: array[np.intp],
+        counts: array[np.int32],
+        np_rng: np.random.Generator | None,
+        room_keys: array[np.uint64] | None = None
+) -> None:
+    rooms = available_list[:, 0]
+    if room_keys is None:
+        draws = np_rng.random(rooms.size)
+    else:
+        draws = key_uniforms(mix_keys(room_keys[rooms], _room_ordinals(rooms)))
+    order = np.argsort(rooms + draws)
+    ordered_rooms = rooms[order]
+    positions = np.arange(order.size)
+    group_start = np.r_[True, ordered_rooms[1:] != ordered_rooms[:-1]]
+    ranks = positions - np.maximum.accumulate(np.where(group_start, positions, 0))
+    coords = available_list[order[ranks < counts[ordered_rooms]]]
+    if feature in DUPLICATES:
+        tile = DUPLICATES[feature]
+    else:
+        tile = feature
+    blocks[coords[:, 0], coords[:, 1], coords[:, 2]] = tile
     return
 
 @timeit
-def room_populator(
-        tilemap: array[uint8],
-        theme_map: array[uint8],
-        np_rng: np.random.Generator
+def _populate_chunk(
+        room_major: array[uint8] | BlockSparseTilemap,
+        rooms: array[np.intp],
+        counts: array[np.int32],
+        np_rng: np.random.Generator | None,
+        room_keys: array[np.uint64] | None = None
+) -> None:
+    blocks = room_major[rooms[:, 0], rooms[:, 1]]
+    block_bits = neighbor_bits(blocks, np.empty_like(blocks, dtype = np.uint32))
+
+    for column, feature in enumerate(FEATURE_ORDER):
+        active = np.flatnonzero(counts[:, column])
+        if active.size == 0:
+            continue
+        active_blocks = blocks[active]
+        active_bits = block_bits[active]
+        available_list = _scan_rooms(
+            active_blocks, active_bits, **SCAN_MASKS[feature]
+        )
+        if available_list.size == 0:
+            continue
+        active_keys = None
+        if room_keys is not None:
+            active_keys = mix_keys(room_keys[active], 1 + column)
+        _place_rooms(
+            active_blocks, feature, available_list, counts[active, column],
+            np_rng, active_keys
+        )
+        blocks[active] = active_blocks
+        block_bits[active] = neighbor_bits(active_blocks, active_bits)
+
+    room_major[rooms[:, 0], rooms[:, 1]] = blocks
+    return
+
+@timeit
+def _populate_rooms(
+        tilemap: array[uint8] | BlockSparseTilemap,
+        rooms: array[np.intp],
+        counts: array[np.int32],
+        np_rng: np.random.Generator | None,
+        room_size: int = Const.ROOM_SIZE,
+        room_keys: array[np.uint64] | None = None
+) -> array[uint8] | BlockSparseTilemap:
+    if isinstance(tilemap, BlockSparseTilemap):
+        room_major = tilemap.room_major_view()
+    else:
+        room_major = room_major_view(tilemap, room_size)
+    for start in range(0, len(rooms), ROOM_CHUNK):
+        _populate_chunk(
+            room_major,
+            rooms[start:start + ROOM_CHUNK],
+            counts[start:start + ROOM_CHUNK],
+            np_rng,
+            None if room_keys is None else room_keys[start:start + ROOM_CHUNK]
+        )
+    return tilemap
+
+@timeit
+def keyed_room_populator(
+        tilemap: array[uint8] | BlockSparseTilemap,
+        rooms: array[np.intp],
+        themes: array[uint8],
+        room_keys: array[np.uint64],
+        config: DungeonConfig = DEFAULT_CONFIG
+) -> array[uint8] | BlockSparseTilemap:
+    counts = resolve_keyed_counts(themes, room_keys)
+    return _populate_rooms(tilemap, rooms, counts, None, config.room_size, room_keys)
+
+@timeit
+def populate_room(
+        room_view: array[uint8],
+        resolved: list[int],
+        np_rng: np.random.Generator,
+        room_bits: array[np.uint32],
+        template_id: int | None = None
 ) -> array[uint8]:
-    feature_mapping = _resolve_counts(theme_map, np_rng)
-    neighbor_map = np.empty_like(tilemap, dtype=uint8)
-    rs = Const.ROOM_SIZE
-
-    for (room_row, room_col), resolved in feature_mapping.items():
-        y = room_row * rs
-        x = room_col * rs
-        room_view = tilemap[y:y + rs, x:x + rs]
-        room_neighbor = neighbor_map[y:y + rs, x:x + rs]
-
-        for feature in FEATURE_ORDER:
-            count = resolved.get(feature, 0)
-            if not count:
-                continue
+    neighbor_bits(room_view, room_bits)
+    candidates = None
+    if template_id is not None:
+        candidates = _template_candidates(room_view, room_bits, template_id)
+    pristine = True
+
+    for feature, count in zip(FEATURE_ORDER, resolved):
+        if not count:
+            continue
+        if candidates is None:
+            available_list = _scan_tilemap(
+                room_view, room_bits, **SCAN_MASKS[feature]
+            )
+        elif pristine:
+            available_list = candidates[feature][0]
+        else:
             available_list = _scan_tilemap(
-                room_view, room_neighbor, **SCAN_PARAMS[feature]
+                room_view, room_bits, **SCAN_MASKS[feature],
+                candidates = candidates[feature][1]
             )
-            if available_list.size == 0:
-                continue
-            _place(room_view, feature, available_list, count, np_rng)
+        if available_list.size == 0:
+            continue
+        coords = _place(room_view, feature, available_list, count, np_rng)
+        pristine = False
+        update_neighbor_bits(room_view, room_bits, coords)
+    return room_view
+
+@timeit
+def room_populator(
+        tilemap: array[uint8] | BlockSparseTilemap,
+        theme_map: array[uint8],
+        np_rng: np.random.Generator,
+        vectorized: bool = False,
+        template_map: array[np.int16] | None = None,
+        bit_map: array[np.uint32] | None = None,
+        config: DungeonConfig = DEFAULT_CONFIG
+) -> array[uint8] | BlockSparseTilemap:
+    rooms, counts = resolve_counts(theme_map, np_rng)
+    rs = config.room_size
+    if vectorized:
+        return _populate_rooms(tilemap, rooms, counts, np_rng, rs)
+    if bit_map is None:
+        bit_map = np.empty((rs, rs), dtype=np.uint32)
+    room_bits = bit_map[:rs, :rs]
+    sparse = isinstance(tilemap, BlockSparseTilemap)
+
+    for (room_row, room_col), resolved in zip(rooms.tolist(), counts.tolist()):
+        if sparse:
+            room_view = tilemap.room(room_row, room_col)
+        elif tilemap.ndim == 4:
+            room_view = tilemap[room_row, room_col]
+        else:
+            y = room_row * rs
+            x = room_col * rs
+            room_view = tilemap[y:y + rs, x:x + rs]
+        template_id = None
+        if template_map is not None:
+            template_id = int(template_map[room_row, room_col])
+        populate_room(room_view, resolved, np_rng, room_bits, template_id)
 
-    return tilemap
\ No newline at end of file
+    return tilemap
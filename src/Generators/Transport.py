@@ -0,0 +1,159 @@
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from types import TracebackType
+
+import numpy as np
+from numpy import uint8
+from numpy.typing import NDArray as array
+
+from Gen_Helpers import DungeonConfig, DEFAULT_CONFIG
+from Generator import DungeonGenerator
+
+_Shape = tuple[int, int]
+_worker_slots: list[tuple[array[uint8], array[uint8]]] = []
+_worker_memory: SharedMemory | None = None
+_worker_generator: DungeonGenerator | None = None
+
+def _slot_views(
+        buffer: memoryview,
+        slots: int,
+        tilemap_shape: _Shape,
+        theme_shape: _Shape
+) -> list[tuple[array[uint8], array[uint8]]]:
+    tile_size = tilemap_shape[0] * tilemap_shape[1]
+    theme_size = theme_shape[0] * theme_shape[1]
+    ring = np.ndarray((slots, tile_size + theme_size), dtype = uint8, buffer = buffer)
+    return [
+        (
+            row[:tile_size].reshape(tilemap_shape),
+            row[tile_size:].reshape(theme_shape)
+        )
+        for row in ring
+    ]
+
+def _init_worker(
+        name: str,
+        slots: int,
+        vectorized: bool,
+        config: DungeonConfig
+) -> None:
+    global _worker_memory, _worker_generator, _worker_slots
+    _worker_generator = DungeonGenerator(vectorized, config)
+    _worker_memory = SharedMemory(name = name)
+    _worker_slots = _slot_views(
+        _worker_memory.buf,
+        slots,
+        _worker_generator.tilemap_shape,
+        _worker_generator.theme_shape
+    )
+    return
+
+def _generate_into_slot(seed: int | None, slot: int) -> tuple[_Shape, _Shape]:
+    out_tilemap, out_theme_map = _worker_slots[slot]
+    tilemap, theme_map = _worker_generator.generate_into(out_tilemap, out_theme_map, seed)
+    return tilemap.shape, theme_map.shape
+
+class SharedDungeon:
+    def __init__(
+            self,
+            seed: int | None,
+            tilemap: array[uint8],
+            theme_map: array[uint8],
+            slot: int,
+            free_slots: deque[int]
+    ) -> None:
+        self.seed = seed
+        self.tilemap = tilemap
+        self.theme_map = theme_map
+        self._slot = slot
+        self._free_slots = free_slots
+
+    def __enter__(self) -> "SharedDungeon":
+        return self
+
+    def __exit__(
+            self,
+            exc_type: type[BaseException] | None,
+            exc: BaseException | None,
+            traceback: TracebackType | None
+    ) -> None:
+        self.release()
+        return
+
+    @property
+    def released(self) -> bool:
+        return self._slot is None
+
+    def release(self) -> None:
+        if self._slot is None:
+            return
+        self._free_slots.append(self._slot)
+        self._slot = None
+        self.tilemap = None
+        self.theme_map = None
+        return
+
+def iter_shared_dungeons(
+        seed_source: Iterable[int | None],
+        slots: int = 4,
+        workers: int | None = None,
+        vectorized: bool = False,
+        config: DungeonConfig = DEFAULT_CONFIG
+) -> Iterator[SharedDungeon]:
+    if slots < 1:
+        raise ValueError(f"iter_shared_dungeons needs slots >= 1, got {slots}.")
+    slot_bytes = (
+        config.tilemap_shape[0] * config.tilemap_shape[1]
+        + config.theme_shape[0] * config.theme_shape[1]
+    )
+    memory = SharedMemory(create = True, size = slots * slot_bytes)
+    ring = _slot_views(memory.buf, slots, config.tilemap_shape, config.theme_shape)
+    seeds = iter(seed_source)
+    free_slots: deque[int] = deque(range(slots))
+    pending: deque[tuple[int | None, int, Future[tuple[_Shape, _Shape]]]] = deque()
+    pool = ProcessPoolExecutor(
+        max_workers = workers or slots,
+        initializer = _init_worker,
+        initargs = (memory.name, slots, vectorized, config)
+    )
+
+    def refill() -> bool:
+        while free_slots:
+            seed = next(seeds, StopIteration)
+            if seed is StopIteration:
+                return True
+            slot = free_slots.popleft()
+            pending.append((seed, slot, pool.submit(_generate_into_slot, seed, slot)))
+        return False
+
+    try:
+        exhausted = refill()
+        while pending:
+            seed, slot, future = pending.popleft()
+            (tile_h, tile_w), (theme_h, theme_w) = future.result()
+            out_tilemap, out_theme_map = ring[slot]
+            yield SharedDungeon(
+                seed,
+                out_tilemap[:tile_h, :tile_w],
+                out_theme_map[:theme_h, :theme_w],
+                slot,
+                free_slots
+            )
+            exhausted = exhausted or refill()
+            if not pending and not exhausted:
+                raise RuntimeError(
+                    "iter_shared_dungeons has no free slots; release earlier dungeons "
+                    "before asking for more."
+                )
+    finally:
+        for _, _, future in pending:
+            future.cancel()
+        pool.shutdown(wait = True, cancel_futures = True)
+        del ring
+        try:
+            memory.close()
+        except BufferError:
+            pass
+        memory.unlink()
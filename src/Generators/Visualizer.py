@@ -24,7 +24,7 @@ from Debug import (
     reset_timings,
     write_timings_to_file
 )
-from Gen_Helpers import Theme, Tile, Const
+from Gen_Helpers import Theme, Tile, Const, derive_seed
 
 def _reload(root):
     subprocess.Popen([sys.executable] + sys.argv)
@@ -36,7 +36,7 @@ def _init_seeds(seed_str: StringVar) -> tuple[np.random.Generator, Random]:
     seed_val = seed_str.get()
     if (seed_str != "") and (seed_val != "Seed"):
         seed_val = seed_str.get()
-        seed = int(seed_val) if seed_val.isdigit() else abs(hash(seed_val))
+        seed = derive_seed(seed_val)
     else:
         seed = None
     np_rng = np.random.default_rng(seed)